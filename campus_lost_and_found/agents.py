@@ -1,8 +1,26 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator, AsyncIterator
+from functools import lru_cache
+from hashlib import blake2b
+import asyncio
+import atexit
 import json
+import logging
 import os
-from models import Item, ItemType
+import re
+import threading
+import weakref
+from cachetools import TTLCache
+from sqlalchemy import insert, select
+from models import Item, ItemType, Turn
+from config import (
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_RESPONSE_CACHE_SIZE, LLM_RESPONSE_CACHE_TTL,
+    HISTORY_SUMMARY_THRESHOLD, HISTORY_ANCHOR_MESSAGES, HISTORY_RECENT_MESSAGES, HISTORY_MAX_CHARS,
+    TURN_FLUSH_EVERY
+)
+
+logger = logging.getLogger(__name__)
 
 # 尝试加载环境变量
 try:
@@ -11,6 +29,134 @@ try:
 except ImportError:
     pass
 
+# --- HTTP 客户端 ---
+
+# 按 base_url 共享 httpx.Client，所有 OpenAI 兼容客户端复用同一连接池（keep-alive）
+_HTTP_CLIENTS: Dict[str, Any] = {}
+# 异步连接池绑定在创建它的事件循环上，因此按事件循环分别缓存
+_ASYNC_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _http_client_options() -> Dict[str, Any]:
+    import httpx
+    return {
+        "timeout": httpx.Timeout(60.0, connect=10.0),
+        "limits": httpx.Limits(
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=30
+        )
+    }
+
+
+def get_http_client(base_url: str):
+    """获取（或创建）指定 base_url 共享的 httpx.Client"""
+    client = _HTTP_CLIENTS.get(base_url)
+    if client is None:
+        import httpx
+        # 不带代理的 http client
+        client = httpx.Client(**_http_client_options())
+        _HTTP_CLIENTS[base_url] = client
+    return client
+
+
+def get_async_http_client(base_url: str):
+    """获取（或创建）当前事件循环中指定 base_url 共享的 httpx.AsyncClient"""
+    clients = _ASYNC_HTTP_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(base_url)
+    if client is None:
+        import httpx
+        client = httpx.AsyncClient(**_http_client_options())
+        clients[base_url] = client
+    return client
+
+
+# 同步代码（如 BatchNegotiator）经 generate_batch 发起并发请求时，每个线程固定使用一个事件循环，
+# 按事件循环缓存的异步连接池因此能跨轮次、跨会话复用，而不是每次 asyncio.run 都新建一个
+_THREAD_LOOPS = threading.local()
+
+
+def _thread_event_loop() -> asyncio.AbstractEventLoop:
+    """当前线程专用的事件循环（不存在则创建）"""
+    loop = getattr(_THREAD_LOOPS, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _THREAD_LOOPS.loop = loop
+    return loop
+
+
+@atexit.register
+def _close_http_clients():
+    for client in _HTTP_CLIENTS.values():
+        client.close()
+    _HTTP_CLIENTS.clear()
+    
+    # 关闭各线程事件循环中的异步连接池（运行中的循环由其所有者负责关闭）
+    for loop, clients in list(_ASYNC_HTTP_CLIENTS.items()):
+        if loop.is_closed() or loop.is_running():
+            continue
+        for client in clients.values():
+            try:
+                loop.run_until_complete(client.aclose())
+            except Exception:
+                pass
+    _ASYNC_HTTP_CLIENTS.clear()
+
+
+# --- LLM 响应缓存 ---
+
+# 以 (system_prompt, user_prompt) 的摘要为键；user_prompt 已包含完整对话历史，
+# 因此上下文不同的追问不会误命中
+_RESPONSE_CACHE: Optional[TTLCache] = (
+    TTLCache(maxsize=LLM_RESPONSE_CACHE_SIZE, ttl=LLM_RESPONSE_CACHE_TTL)
+    if LLM_RESPONSE_CACHE_TTL > 0 else None
+)
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def _response_cache_key(system_prompt: str, user_prompt: str) -> bytes:
+    return blake2b((system_prompt + "\x1e" + user_prompt).encode("utf-8"), digest_size=16).digest()
+
+
+@lru_cache(maxsize=1024)
+def _system_message(system_prompt: str) -> Dict[str, str]:
+    """系统提示词对应的 message 字典；同一 Agent 的系统提示词不变，跨轮复用（只读，勿修改）"""
+    return {"role": "system", "content": system_prompt}
+
+
+# --- 流式 JSON 截断 ---
+
+class _JsonObjectScanner:
+    """
+    增量扫描流式输出的 JSON 文本，顶层对象闭合时给出结束位置，
+    调用方据此提前结束流式读取，不必等待模型输出尾部的空白/多余 token
+    """
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """返回顶层对象在 text 中闭合后的下标，尚未闭合返回 None"""
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
+
+
 # --- LLM Interface ---
 
 class LLMInterface(ABC):
@@ -18,6 +164,35 @@ class LLMInterface(ABC):
     def generate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         pass
 
+    async def agenerate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        """异步生成响应，默认在线程池中执行同步实现"""
+        return await asyncio.to_thread(self.generate_response, system_prompt, user_prompt)
+
+    async def agenerate_batch(self, requests: List[Tuple[str, str]], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        批量生成响应，请求之间并发执行
+
+        Args:
+            requests: (system_prompt, user_prompt) 列表
+            max_concurrency: 最大并发请求数
+
+        Returns:
+            与 requests 顺序一致的响应列表
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.agenerate_response(system_prompt, user_prompt)
+
+        return list(await asyncio.gather(*(run_one(sp, up) for sp, up in requests)))
+
+    def generate_batch(self, requests: List[Tuple[str, str]], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """agenerate_batch 的同步入口（不能在运行中的事件循环里调用），同一线程的多次调用共用一个事件循环"""
+        if not requests:
+            return []
+        return _thread_event_loop().run_until_complete(self.agenerate_batch(requests, max_concurrency))
+
 
 class DeepSeekLLM(LLMInterface):
     """
@@ -34,15 +209,82 @@ class DeepSeekLLM(LLMInterface):
         if not self.api_key:
             raise ValueError("DeepSeek API Key 未设置。请设置环境变量 DEEPSEEK_API_KEY 或在构造函数中传入。")
         
-        # 使用 openai 库，配置不带代理的 http client
+        # 使用 openai 库，复用共享的 http client
         from openai import OpenAI
-        import httpx
-        http_client = httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0))
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
-            http_client=http_client
+            http_client=get_http_client(self.base_url)
         )
+        self._async_clients = weakref.WeakKeyDictionary()
+        # 不随调用变化的请求参数只构建一次；messages 每次新建，
+        # 因为批量协商会在多个线程/协程中并发调用同一个实例
+        self._request_template = {
+            "model": self.model,
+            "temperature": 0.7,
+            "max_tokens": 500,
+            "response_format": {"type": "json_object"},
+            "stream": True
+        }
+    
+    def _get_async_client(self):
+        """获取当前事件循环对应的 AsyncOpenAI 客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=get_async_http_client(self.base_url)
+            )
+            self._async_clients[loop] = client
+        return client
+    
+    def _build_request(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        return {
+            **self._request_template,
+            "messages": [_system_message(system_prompt), {"role": "user", "content": user_prompt}]
+        }
+    
+    def _parse_content(self, content: str) -> Dict[str, Any]:
+        result = json.loads(content)
+        
+        # 确保返回格式正确
+        if "action" not in result:
+            result["action"] = "ASK"
+        if "content" not in result:
+            result["content"] = "请问物品有什么具体特征？"
+            
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[DeepSeek] Response: {result}")
+        return result
+    
+    def _get_cached(self, cache_key: bytes) -> Optional[Dict[str, Any]]:
+        if _RESPONSE_CACHE is None:
+            return None
+        with _RESPONSE_CACHE_LOCK:
+            cached = _RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[DeepSeek] Cache hit: {cached}")
+            return dict(cached)
+        return None
+    
+    def _set_cached(self, cache_key: bytes, result: Dict[str, Any]) -> Dict[str, Any]:
+        # 只缓存成功的响应，降级回复不缓存
+        if _RESPONSE_CACHE is not None:
+            with _RESPONSE_CACHE_LOCK:
+                _RESPONSE_CACHE[cache_key] = dict(result)
+        return result
+    
+    def _fallback_response(self, error: Exception) -> Dict[str, Any]:
+        logger.warning("[DeepSeek] API Error: %s", error)
+        # 降级到简单回复
+        return {
+            "action": "ASK",
+            "content": "请问物品有什么具体特征可以描述一下吗？"
+        }
     
     def generate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         """
@@ -50,82 +292,125 @@ class DeepSeekLLM(LLMInterface):
         
         返回格式: {"action": "ASK|ANSWER|CONFIRM|REJECT|PROPOSE_MEET|AGREE", "content": "消息内容"}
         """
+        cache_key = _response_cache_key(system_prompt, user_prompt)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            result = json.loads(content)
-            
-            # 确保返回格式正确
-            if "action" not in result:
-                result["action"] = "ASK"
-            if "content" not in result:
-                result["content"] = "请问物品有什么具体特征？"
-                
-            print(f"[DeepSeek] Response: {result}")
-            return result
-            
+            content = "".join(self.generate_response_stream(system_prompt, user_prompt))
+            return self._set_cached(cache_key, self._parse_content(content))
         except Exception as e:
-            print(f"[DeepSeek] API Error: {e}")
-            # 降级到简单回复
-            return {
-                "action": "ASK",
-                "content": "请问物品有什么具体特征可以描述一下吗？"
-            }
+            return self._fallback_response(e)
+    
+    def generate_response_stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """
+        流式调用 DeepSeek API，逐段产出 JSON 文本
+        
+        顶层 JSON 对象闭合后立即关闭连接，不再读取剩余输出
+        """
+        stream = self.client.chat.completions.create(
+            **self._build_request(system_prompt, user_prompt)
+        )
+        scanner = _JsonObjectScanner()
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                end = scanner.feed(delta)
+                if end is not None:
+                    yield delta[:end]
+                    return
+                yield delta
+        finally:
+            stream.close()
+    
+    async def agenerate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        """异步调用 DeepSeek API，不阻塞事件循环，多个协商可并发等待"""
+        cache_key = _response_cache_key(system_prompt, user_prompt)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            content = "".join([delta async for delta in self.agenerate_response_stream(system_prompt, user_prompt)])
+            return self._set_cached(cache_key, self._parse_content(content))
+        except Exception as e:
+            return self._fallback_response(e)
+    
+    async def agenerate_response_stream(self, system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+        """generate_response_stream 的异步版本"""
+        stream = await self._get_async_client().chat.completions.create(
+            **self._build_request(system_prompt, user_prompt)
+        )
+        scanner = _JsonObjectScanner()
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                end = scanner.feed(delta)
+                if end is not None:
+                    yield delta[:end]
+                    return
+                yield delta
+        finally:
+            await stream.close()
 
 
 class MockLLM(LLMInterface):
     """
     模拟大语言模型 (用于测试或无 API Key 时)
     """
+    # 按优先级排列的 (关键词, 回复)，命中多个时取优先级最高者
+    _RULES = [
+        # 检查是否有不匹配的关键词（模拟不匹配场景）
+        (("不一致", "不对", "不是"), {"action": "REJECT", "content": "抱歉，根据您的描述，这个物品似乎不是您丢失的那个。"}),
+        (("时间", "地点", "见面"), {"action": "AGREE", "content": "好的，我们在图书馆门口见。"}),
+        (("确认", "一致"), {"action": "PROPOSE_MEET", "content": "特征相符，我们可以约定一个地点见面核实吗？"}),
+        (("黑色", "索尼", "Sony", "SONY"), {"action": "CONFIRM", "content": "描述与我的物品一致，我确认这是我要找的物品。"}),
+        (("特征", "是什么", "品牌"), {"action": "ANSWER", "content": "这是一个黑色的索尼(Sony)耳机。"}),
+    ]
+    _DEFAULT_RESPONSE = {"action": "ASK", "content": "请问物品有什么具体的特征吗？比如颜色、品牌等。"}
+    
+    # 关键词 -> 优先级；零宽前瞻使每个位置都参与匹配，一次扫描即可找出所有命中
+    _KEYWORD_PRIORITY = {kw: priority for priority, (keywords, _) in enumerate(_RULES) for kw in keywords}
+    _KEYWORD_RE = re.compile("(?=(" + "|".join(re.escape(kw) for kw in _KEYWORD_PRIORITY) + "))")
+    
     def __init__(self):
         self.round_count = 0
     
     def generate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         self.round_count += 1
-        lines = [line for line in user_prompt.splitlines() if ":" in line and "对话历史" not in line]
-        last_message = lines[-1] if lines else ""
-        
-        # 检查是否有不匹配的关键词（模拟不匹配场景）
-        if "不一致" in last_message or "不对" in last_message or "不是" in last_message:
-            return {"action": "REJECT", "content": "抱歉，根据您的描述，这个物品似乎不是您丢失的那个。"}
+        last_message = next(
+            (line for line in reversed(user_prompt.splitlines()) if ":" in line and "对话历史" not in line),
+            ""
+        )
         
-        if "时间" in last_message or "地点" in last_message or "见面" in last_message:
-            return {"action": "AGREE", "content": "好的，我们在图书馆门口见。"}
-        elif "确认" in last_message or "一致" in last_message:
-            return {"action": "PROPOSE_MEET", "content": "特征相符，我们可以约定一个地点见面核实吗？"}
-        elif any(kw in last_message for kw in ["黑色", "索尼", "Sony", "SONY"]):
-            return {"action": "CONFIRM", "content": "描述与我的物品一致，我确认这是我要找的物品。"}
-        elif "特征" in last_message or "是什么" in last_message or "品牌" in last_message:
-            return {"action": "ANSWER", "content": "这是一个黑色的索尼(Sony)耳机。"}
-        else:
-            return {"action": "ASK", "content": "请问物品有什么具体的特征吗？比如颜色、品牌等。"}
+        priority = min(
+            (self._KEYWORD_PRIORITY[kw] for kw in self._KEYWORD_RE.findall(last_message)),
+            default=None
+        )
+        if priority is None:
+            return dict(self._DEFAULT_RESPONSE)
+        return dict(self._RULES[priority][1])
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        # 纯本地计算，无需切换线程
+        return self.generate_response(system_prompt, user_prompt)
 
 
 # --- 智能 Prompt 构建器 ---
+# 与物品无关的指令放在前面作为固定前缀，物品信息追加在末尾，
+# 使每次请求的前缀字节一致，便于 DeepSeek 的上下文缓存（前缀缓存）命中。
 
-def build_seeker_system_prompt(item: Item) -> str:
-    """构建失主智能体的 System Prompt"""
-    return f"""你是一个校园失物招领系统中的"失主代理人"(SeekerAgent)。
+SEEKER_SYSTEM_PROMPT_PREFIX = """你是一个校园失物招领系统中的"失主代理人"(SeekerAgent)。
 
 ## 你的身份
 - 你代表失主进行物品认领协商
 - 你需要验证对方捡到的物品是否就是失主丢失的物品
 
-## 你持有的物品信息（这是你知道的全部信息）
-- 物品名称: {item.title}
-- 物品描述: {item.description}
-- 丢失地点: {item.location}
-
 ## 你的任务
 1. 向对方提问，验证物品特征是否匹配（如品牌、颜色、型号等）
 2. 根据对方的回答判断是否匹配
@@ -144,7 +429,7 @@ def build_seeker_system_prompt(item: Item) -> str:
 - "content": 具体的消息内容（中文）
 
 ## ⚠️ 重要规则（必须遵守）
-1. **绝对禁止编造信息**：你只知道上面"物品信息"中给出的内容，不要编造型号、材质、尺寸等未提供的细节
+1. **绝对禁止编造信息**：你只知道下面"物品信息"中给出的内容，不要编造型号、材质、尺寸等未提供的细节
 2. 如果对方问你不知道的细节（如型号），诚实回答"抱歉，我只知道它是XXX，不清楚具体型号"
 3. 不要一次性问太多问题，每次只问一个关键问题
 4. 如果对方描述的特征与你的物品信息匹配，就确认并提议见面
@@ -152,20 +437,12 @@ def build_seeker_system_prompt(item: Item) -> str:
 6. 保持礼貌友好的语气
 """
 
-
-def build_finder_system_prompt(item: Item) -> str:
-    """构建拾主智能体的 System Prompt"""
-    return f"""你是一个校园失物招领系统中的"拾主代理人"(FinderAgent)。
+FINDER_SYSTEM_PROMPT_PREFIX = """你是一个校园失物招领系统中的"拾主代理人"(FinderAgent)。
 
 ## 你的身份
 - 你代表捡到物品的人进行协商
 - 你需要验证对方是否是真正的失主
 
-## 你持有的物品信息（这是你知道的全部信息）
-- 物品名称: {item.title}
-- 物品描述: {item.description}
-- 拾得地点: {item.location}
-
 ## 你的任务
 1. 回答对方关于物品特征的问题
 2. 也可以反问对方，验证其是否是真正的失主
@@ -184,7 +461,7 @@ def build_finder_system_prompt(item: Item) -> str:
 - "content": 具体的消息内容（中文）
 
 ## ⚠️ 重要规则（必须遵守）
-1. **绝对禁止编造信息**：你只知道上面"物品信息"中给出的内容，不要编造型号、材质、尺寸等未提供的细节
+1. **绝对禁止编造信息**：你只知道下面"物品信息"中给出的内容，不要编造型号、材质、尺寸等未提供的细节
 2. 如果对方问你不知道的细节，诚实回答"抱歉，我的描述中没有提到这个，我只知道它是XXX"
 3. 根据你持有的物品信息诚实回答问题
 4. 如果对方提议见面且之前的验证通过，就同意
@@ -193,6 +470,38 @@ def build_finder_system_prompt(item: Item) -> str:
 """
 
 
+def build_seeker_system_prompt(item: Item) -> str:
+    """构建失主智能体的 System Prompt"""
+    return _format_seeker_system_prompt(item.title, item.description, item.location)
+
+
+@lru_cache(maxsize=1024)
+def _format_seeker_system_prompt(title: str, description: str, location: str) -> str:
+    """按物品字段缓存失主 Prompt，避免每轮决策重复拼接"""
+    return SEEKER_SYSTEM_PROMPT_PREFIX + f"""
+## 你持有的物品信息（这是你知道的全部信息）
+- 物品名称: {title}
+- 物品描述: {description}
+- 丢失地点: {location}
+"""
+
+
+def build_finder_system_prompt(item: Item) -> str:
+    """构建拾主智能体的 System Prompt"""
+    return _format_finder_system_prompt(item.title, item.description, item.location)
+
+
+@lru_cache(maxsize=1024)
+def _format_finder_system_prompt(title: str, description: str, location: str) -> str:
+    """按物品字段缓存拾主 Prompt，避免每轮决策重复拼接"""
+    return FINDER_SYSTEM_PROMPT_PREFIX + f"""
+## 你持有的物品信息（这是你知道的全部信息）
+- 物品名称: {title}
+- 物品描述: {description}
+- 拾得地点: {location}
+"""
+
+
 # --- Agent Definitions ---
 
 class BaseAgent(ABC):
@@ -200,13 +509,41 @@ class BaseAgent(ABC):
     智能体基类 (Base Agent Class)
     
     定义了所有智能体必须遵循的"感知-决策-执行" (Perception-Decision-Action) 循环接口。
+    
+    传入 db 和 conv_id 时，发出的每条消息会写入 Turn 表（每 TURN_FLUSH_EVERY 条批量写入一次），
+    创建时也会从 Turn 表恢复记忆。
     """
-    def __init__(self, name: str, role: str, llm: LLMInterface, item_knowledge: Item):
+    def __init__(self, name: str, role: str, llm: LLMInterface, item_knowledge: Item,
+                 db=None, conv_id: Optional[int] = None):
         self.name = name
         self.role = role
         self.llm = llm
         self.item_knowledge = item_knowledge
         self.memory: List[Dict[str, str]] = []
+        self.db = db
+        self.conv_id = conv_id
+        self._pending_turns: List[Dict[str, Any]] = []
+        
+        if db is not None and conv_id is not None:
+            self.memory = self._load_turns()
+
+    def _load_turns(self) -> List[Dict[str, str]]:
+        """一次查询取回对话的全部轮次"""
+        turns = self.db.execute(
+            select(Turn.sender, Turn.content, Turn.action_type)
+            .where(Turn.conv_id == self.conv_id)
+            .order_by(Turn.idx)
+        ).all()
+        return [
+            {"sender": sender, "content": content, "action_type": action_type}
+            for sender, content, action_type in turns
+        ]
+
+    def flush_turns(self):
+        """把缓冲的轮次批量写入数据库（由调用方提交事务）"""
+        if self._pending_turns:
+            self.db.execute(insert(Turn), self._pending_turns)
+            self._pending_turns = []
 
     def perceive(self, message: Dict[str, str]):
         """
@@ -215,29 +552,67 @@ class BaseAgent(ABC):
         """
         if message:
             self.memory.append(message)
-            print(f"[{self.name}] Perceived message from {message.get('sender')}: {message.get('content')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[{self.name}] Perceived message from {message.get('sender')}: {message.get('content')}")
 
     @abstractmethod
     def _build_system_prompt(self) -> str:
         """子类实现：构建系统提示词"""
         pass
 
+    def _summarize_memory(self) -> List[Dict[str, str]]:
+        """
+        压缩对话历史，避免每轮重发全部历史导致 token 随轮数平方增长
+        
+        保留开头几条作为锚点、最近几条原文，中间部分按规则压缩为一条摘要（不额外调用 LLM）
+        """
+        if len(self.memory) <= HISTORY_SUMMARY_THRESHOLD:
+            return self.memory
+        
+        head = self.memory[:HISTORY_ANCHOR_MESSAGES]
+        middle = self.memory[HISTORY_ANCHOR_MESSAGES:-HISTORY_RECENT_MESSAGES]
+        tail = self.memory[-HISTORY_RECENT_MESSAGES:]
+        
+        points = []
+        for m in middle:
+            content = m.get("content") or ""
+            if len(content) > 30:
+                content = content[:30] + "…"
+            action = f"({m['action_type']})" if m.get("action_type") else ""
+            points.append(f"{m['sender']}{action}「{content}」")
+        summary = {"sender": "【历史摘要】", "content": f"省略了 {len(middle)} 条消息：" + "；".join(points)}
+        
+        return head + [summary] + tail
+
+    def _build_user_prompt(self) -> str:
+        """基于记忆构建对话历史提示词"""
+        if self.memory:
+            history_str = "\n".join([f"{m['sender']}: {m['content']}" for m in self._summarize_memory()])
+            if len(history_str) > HISTORY_MAX_CHARS:
+                # 超长时保留最近的部分
+                history_str = "…" + history_str[-HISTORY_MAX_CHARS:]
+            return f"对话历史:\n{history_str}\n\n请根据对话历史决定你的下一步行动，返回 JSON 格式的响应。"
+        return "这是协商的开始，请发起第一个问题来验证物品信息，返回 JSON 格式的响应。"
+
     def decide(self) -> Dict[str, str]:
         """
         决策层 (Decision Layer)
         基于记忆和目标，利用 LLM 进行推理，决定下一步动作。
         """
         system_prompt = self._build_system_prompt()
-        
-        # 构建对话历史
-        if self.memory:
-            history_str = "\n".join([f"{m['sender']}: {m['content']}" for m in self.memory])
-            user_prompt = f"对话历史:\n{history_str}\n\n请根据对话历史决定你的下一步行动，返回 JSON 格式的响应。"
-        else:
-            user_prompt = "这是协商的开始，请发起第一个问题来验证物品信息，返回 JSON 格式的响应。"
+        user_prompt = self._build_user_prompt()
 
         decision = self.llm.generate_response(system_prompt, user_prompt)
-        print(f"[{self.name}] Decided action: {decision.get('action')}")
+        logger.debug("[%s] Decided action: %s", self.name, decision.get('action'))
+        return decision
+
+    async def adecide(self) -> Dict[str, str]:
+        """决策层的异步版本，等待 LLM 时让出事件循环"""
+        system_prompt = self._build_system_prompt()
+        user_prompt = self._build_user_prompt()
+
+        decision = await self.llm.agenerate_response(system_prompt, user_prompt)
+        logger.debug("[%s] Decided action: %s", self.name, decision.get('action'))
         return decision
 
     def execute(self, decision: Dict[str, str]) -> Dict[str, str]:
@@ -255,14 +630,27 @@ class BaseAgent(ABC):
         }
         
         self.memory.append(outgoing_message)
+        
+        if self.conv_id is not None:
+            self._pending_turns.append({
+                "conv_id": self.conv_id,
+                "idx": len(self.memory) - 1,
+                "sender": self.role,
+                "action_type": action,
+                "content": content,
+                "system_prompt_hash": blake2b(self._build_system_prompt().encode("utf-8"), digest_size=16).hexdigest()
+            })
+            if len(self._pending_turns) >= TURN_FLUSH_EVERY:
+                self.flush_turns()
         return outgoing_message
 
 
 class SeekerAgent(BaseAgent):
     """失主智能体 - 代表丢失物品的人"""
     
-    def __init__(self, name: str, llm: LLMInterface, item_knowledge: Item):
-        super().__init__(name, "Seeker", llm, item_knowledge)
+    def __init__(self, name: str, llm: LLMInterface, item_knowledge: Item,
+                 db=None, conv_id: Optional[int] = None):
+        super().__init__(name, "Seeker", llm, item_knowledge, db, conv_id)
 
     def _build_system_prompt(self) -> str:
         return build_seeker_system_prompt(self.item_knowledge)
@@ -271,8 +659,9 @@ class SeekerAgent(BaseAgent):
 class FinderAgent(BaseAgent):
     """拾主智能体 - 代表捡到物品的人"""
     
-    def __init__(self, name: str, llm: LLMInterface, item_knowledge: Item):
-        super().__init__(name, "Finder", llm, item_knowledge)
+    def __init__(self, name: str, llm: LLMInterface, item_knowledge: Item,
+                 db=None, conv_id: Optional[int] = None):
+        super().__init__(name, "Finder", llm, item_knowledge, db, conv_id)
 
     def _build_system_prompt(self) -> str:
         return build_finder_system_prompt(self.item_knowledge)
@@ -291,13 +680,13 @@ def create_llm(use_mock: bool = False) -> LLMInterface:
         LLMInterface 实例
     """
     if use_mock:
-        print("[LLM Factory] Using MockLLM")
+        logger.info("[LLM Factory] Using MockLLM")
         return MockLLM()
     
     api_key = os.getenv("DEEPSEEK_API_KEY")
     if api_key:
-        print("[LLM Factory] Using DeepSeekLLM")
+        logger.info("[LLM Factory] Using DeepSeekLLM")
         return DeepSeekLLM(api_key=api_key)
     else:
-        print("[LLM Factory] No API Key found, falling back to MockLLM")
+        logger.warning("[LLM Factory] No API Key found, falling back to MockLLM")
         return MockLLM()
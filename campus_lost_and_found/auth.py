@@ -2,16 +2,24 @@
 用户认证模块
 JWT Token 认证
 """
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
 import bcrypt
+from cachetools import TLRUCache, TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
+)
 from models import User
 
 # OAuth2 Token URL
@@ -56,35 +64,91 @@ class UserResponse(BaseModel):
 
 # ==================== 密码处理 ====================
 
+# 新密码使用 argon2id；旧的 bcrypt 哈希仍可验证，并在登录成功后自动升级
+_password_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM
+)
+
+
+def _is_bcrypt_hash(hashed_password: str) -> bool:
+    return hashed_password.startswith(("$2a$", "$2b$", "$2y$"))
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    if _is_bcrypt_hash(hashed_password):
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    try:
+        return _password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
 
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return _password_hasher.hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """旧算法或旧参数生成的哈希需要重新生成"""
+    return _is_bcrypt_hash(hashed_password) or _password_hasher.check_needs_rehash(hashed_password)
 
 
 # ==================== Token 处理 ====================
 
+# 已签发 Token 的缓存：(username, user_id, 过期分钟) -> token
+# 默认有效期的 exp 按分钟取整，同一用户一分钟内多次登录只做一次签名
+_SIGN_CACHE = TTLCache(maxsize=10_000, ttl=60)
+_SIGN_CACHE_LOCK = threading.Lock()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建 JWT Token"""
     to_encode = data.copy()
     
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        to_encode.update({"exp": expire})
+        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    
+    exp_minute = int(time.time()) // 60 + ACCESS_TOKEN_EXPIRE_MINUTES
+    cacheable = to_encode.keys() <= {"sub", "user_id"}
+    cache_key = (to_encode.get("sub"), to_encode.get("user_id"), exp_minute)
+    if cacheable:
+        with _SIGN_CACHE_LOCK:
+            cached = _SIGN_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": exp_minute * 60})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     
+    if cacheable:
+        with _SIGN_CACHE_LOCK:
+            _SIGN_CACHE[cache_key] = encoded_jwt
     return encoded_jwt
 
 
+# 已验证 Token 的进程内缓存：token -> (TokenData, exp 时间戳)
+# 过期时间取 60 秒与 Token 自身 exp 的较小值，避免缓存已过期的 Token
+_TOKEN_CACHE_TTL = 60
+_TOKEN_CACHE = TLRUCache(
+    maxsize=50_000,
+    ttu=lambda _token, value, now: min(now + _TOKEN_CACHE_TTL, value[1]),
+    timer=time.time
+)
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
 def decode_token(token: str) -> Optional[TokenData]:
     """解码 Token"""
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+    if cached is not None:
+        return cached[0]
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -92,9 +156,14 @@ def decode_token(token: str) -> Optional[TokenData]:
         
         if username is None:
             return None
-            
-        return TokenData(username=username, user_id=user_id)
-    except JWTError:
+        
+        token_data = TokenData(username=username, user_id=user_id)
+        exp = payload.get("exp")
+        if exp is not None:
+            with _TOKEN_CACHE_LOCK:
+                _TOKEN_CACHE[token] = (token_data, float(exp))
+        return token_data
+    except jwt.InvalidTokenError:
         return None
 
 
@@ -112,7 +181,7 @@ class AuthService:
     
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         """通过 ID 获取用户"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        return self.db.get(User, user_id)
     
     def create_user(self, user_data: UserRegister) -> User:
         """创建新用户"""
@@ -143,6 +212,11 @@ class AuthService:
             return None
         if not verify_password(password, user.password_hash):
             return None
+        
+        # 登录成功时顺便升级旧的密码哈希
+        if password_needs_rehash(user.password_hash):
+            user.password_hash = get_password_hash(password)
+            self.db.commit()
             
         return user
     
@@ -2,7 +2,11 @@
 配置文件
 从环境变量或 .env 文件加载配置
 """
+import atexit
+import logging
+import logging.handlers
 import os
+import queue
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,11 +25,20 @@ DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYS
 USE_SQLITE = os.getenv("USE_SQLITE", "false").lower() == "true"
 SQLITE_URL = "sqlite:///./lost_and_found.db"
 
+# 启动 Web 服务时自动建表（本地开发用）；生产环境在部署时执行一次 init_db
+AUTO_CREATE_DB = os.getenv("AUTO_CREATE_DB", "false").lower() == "true"
+
 # ==================== JWT 配置 ====================
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24小时
 
+# ==================== 密码哈希配置 ====================
+# argon2id 参数（测试环境可调低以加快速度）
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # 单位 KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
 # ==================== AI API 配置 ====================
 # DeepSeek (对话)
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
@@ -35,14 +48,87 @@ DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "")
 DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
+# LLM HTTP 连接池大小（异步并发协商时可调大）
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# LLM 响应缓存（相同 Prompt 直接复用结果，TTL 单位: 秒，0 表示关闭）
+LLM_RESPONSE_CACHE_SIZE = int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "10000"))
+LLM_RESPONSE_CACHE_TTL = int(os.getenv("LLM_RESPONSE_CACHE_TTL", "3600"))
+
+# ==================== 任务队列配置 ====================
+# 配置后图片识别等耗时任务交给 Celery worker 执行（如 redis://redis:6379/0）；
+# 未配置时在 Web 进程内异步执行，适合本地开发
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+
 # ==================== 文件上传配置 ====================
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "static", "uploads")
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
 
+# 服务对外可访问的地址（如 https://lf.example.com），设置后图片识别直接传图片 URL，
+# 不再把图片 base64 内联到请求中
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+# ==================== CORS 配置 ====================
+# 允许跨域访问的前端地址，多个用逗号分隔
+FRONTEND_ORIGIN = [
+    origin.strip().rstrip("/")
+    for origin in os.getenv("FRONTEND_ORIGIN", "http://localhost:8000").split(",")
+    if origin.strip()
+]
+
 # 确保上传目录存在
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # ==================== 协商配置 ====================
 MAX_NEGOTIATION_ROUNDS = 20  # 最大协商轮数
 MIN_MATCH_SCORE = 0.3  # 最低匹配度阈值
+TURN_FLUSH_EVERY = 4  # Agent 对话轮次每累计多少条批量写入一次
+NEGOTIATION_COMMIT_EVERY = 5  # 协商进行中每隔多少轮提交一次（结束时总会提交）
+AUTO_MATCH_CONCURRENCY = int(os.getenv("AUTO_MATCH_CONCURRENCY", "3"))  # 自动匹配时同时协商的候选数
+
+# 全局 TF-IDF 模型：在全部物品上拟合并持久化，匹配时只做 transform；
+# 多个进程/容器需共享同一路径
+TFIDF_MODEL_PATH = os.getenv("TFIDF_MODEL_PATH", os.path.join(os.path.dirname(__file__), "data", "tfidf.joblib"))
+TFIDF_MIN_CORPUS = 50  # 物品数少于该值时不拟合全局模型，按需在参与比较的文本上拟合
+TFIDF_REFIT_EVERY = 50  # 每新增多少个物品重新拟合一次
+
+# 发送给 LLM 的对话历史：超过阈值后保留开头和最近几条，中间部分压缩为摘要
+HISTORY_SUMMARY_THRESHOLD = 8  # 超过该条数才压缩
+HISTORY_ANCHOR_MESSAGES = 2  # 保留开头的消息数
+HISTORY_RECENT_MESSAGES = 4  # 保留最近的消息数
+HISTORY_MAX_CHARS = 3000  # 对话历史的最大字符数
+
+# ==================== 日志配置 ====================
+# DEBUG 会输出每轮协商的消息和决策
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def setup_logging():
+    """
+    日志统一经 QueueHandler 放入队列，由后台线程的 QueueListener 写到 stderr，
+    请求/协商线程不会在输出 I/O 上互相等待
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    
+    # 第三方库可能把自己的 logger 设为 DEBUG（如 jieba），在入队前按 LOG_LEVEL 过滤
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    # httpx 每个请求都会打 INFO 日志，LLM 调用频繁时过于嘈杂
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+setup_logging()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# 测试使用临时目录中的 SQLite，需在任何测试模块导入 main 之前设置
+os.environ.setdefault("USE_SQLITE", "true")
+os.environ.setdefault("AUTO_CREATE_DB", "true")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp())
@@ -3,13 +3,109 @@
 使用阿里云 Qwen-VL 进行图片识别
 """
 import os
+import asyncio
 import base64
-import uuid
+import itertools
+import logging
+import shutil
+import threading
+import time
+from hashlib import blake2b
+from io import BytesIO
 from typing import Optional
-from datetime import datetime
+from cachetools import LRUCache
 from PIL import Image
 
-from config import DASHSCOPE_API_KEY, DASHSCOPE_BASE_URL, UPLOAD_DIR, ALLOWED_EXTENSIONS, MAX_UPLOAD_SIZE
+from agents import get_http_client
+from config import (
+    DASHSCOPE_API_KEY, DASHSCOPE_BASE_URL, UPLOAD_DIR, ALLOWED_EXTENSIONS, MAX_UPLOAD_SIZE,
+    PUBLIC_BASE_URL
+)
+
+logger = logging.getLogger(__name__)
+
+# 允许的文件后缀（供 str.endswith 一次判断）与扩展名到 MIME 类型的映射
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+_EXT_TO_MIME = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+# 文件名 = 纳秒时间戳 + 进程号 + 进程内自增序号，无需 uuid 的随机数读取也能保证唯一
+_FILENAME_COUNTER = itertools.count()
+_PID = os.getpid()
+
+
+def _reset_filename_state():
+    global _FILENAME_COUNTER, _PID
+    _FILENAME_COUNTER = itertools.count()
+    _PID = os.getpid()
+
+
+# 多进程部署时 fork 出的子进程需要刷新进程号
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_filename_state)
+
+# 上传文件分块写盘的块大小
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Linux 上用 O_TMPFILE 创建匿名文件暂存上传内容，写完再链接到目标路径；
+# 文件系统或 /proc 不支持时退回 .tmp 临时文件 + 改名
+_O_TMPFILE = getattr(os, "O_TMPFILE", 0)
+_tmpfile_supported = bool(_O_TMPFILE)
+
+
+def _open_staging_file(file_path: str):
+    """
+    打开上传内容的暂存文件
+    
+    Returns:
+        (文件对象, 临时文件路径)；使用 O_TMPFILE 匿名文件时临时文件路径为 None
+    """
+    global _tmpfile_supported
+    if _tmpfile_supported:
+        try:
+            fd = os.open(os.path.dirname(file_path), _O_TMPFILE | os.O_RDWR, 0o644)
+            return os.fdopen(fd, 'w+b'), None
+        except OSError:
+            _tmpfile_supported = False
+    tmp_path = f"{file_path}.tmp"
+    return open(tmp_path, 'wb'), tmp_path
+
+
+def _publish_staging_file(out, tmp_path: Optional[str], file_path: str):
+    """把写完的暂存文件原子地放到目标路径"""
+    global _tmpfile_supported
+    if tmp_path is None:
+        out.flush()
+        try:
+            os.link(f"/proc/self/fd/{out.fileno()}", file_path)
+            out.close()
+            return
+        except OSError:
+            # 无法通过 /proc 链接匿名文件（如容器沙箱），复制到临时文件后改名
+            _tmpfile_supported = False
+            tmp_path = f"{file_path}.tmp"
+            out.seek(0)
+            try:
+                with open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(out, dst, _UPLOAD_CHUNK_SIZE)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    out.close()
+    os.replace(tmp_path, file_path)
+
+
+# 缩略图缓存目录
+THUMB_DIR = os.path.join(UPLOAD_DIR, "thumbs")
+
+# 图片识别结果缓存，键为 (图片内容摘要, 物品类型)，同一张图片重复识别直接返回
+_DESCRIPTION_CACHE = LRUCache(maxsize=1024)
+_DESCRIPTION_CACHE_LOCK = threading.Lock()
 
 
 class ImageService:
@@ -23,19 +119,15 @@ class ImageService:
         if self.api_key:
             try:
                 from openai import OpenAI
-                import httpx
-                # 创建不带代理的 http client
-                http_client = httpx.Client(
-                    timeout=httpx.Timeout(60.0, connect=10.0)
-                )
+                # 复用共享的 http client
                 self.client = OpenAI(
                     api_key=self.api_key,
                     base_url=self.base_url,
-                    http_client=http_client
+                    http_client=get_http_client(self.base_url)
                 )
-                print("[ImageService] Qwen-VL API 已初始化")
+                logger.info("[ImageService] Qwen-VL API 已初始化")
             except Exception as e:
-                print(f"[ImageService] 初始化失败: {e}")
+                logger.error("[ImageService] 初始化失败: %s", e)
     
     def _get_file_extension(self, filename: str) -> str:
         """获取文件扩展名"""
@@ -43,18 +135,32 @@ class ImageService:
     
     def _is_allowed_file(self, filename: str) -> bool:
         """检查文件类型是否允许"""
-        return self._get_file_extension(filename) in ALLOWED_EXTENSIONS
+        return filename.lower().endswith(_ALLOWED_SUFFIXES)
+    
+    def _sniff_image_type(self, header: bytes) -> Optional[str]:
+        """根据文件头魔数识别图片格式，只需前 12 个字节"""
+        if header.startswith(b'\xff\xd8\xff'):
+            return 'jpeg'
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return 'png'
+        if header.startswith((b'GIF87a', b'GIF89a')):
+            return 'gif'
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return 'webp'
+        return None
     
     def _generate_filename(self, original_filename: str) -> str:
         """生成唯一文件名"""
         ext = self._get_file_extension(original_filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = uuid.uuid4().hex[:8]
-        return f"{timestamp}_{unique_id}.{ext}"
+        return f"{time.time_ns():x}_{_PID:x}_{next(_FILENAME_COUNTER):x}.{ext}"
     
-    def save_image(self, file_content: bytes, original_filename: str) -> Optional[str]:
+    async def save_image(self, file, original_filename: str) -> Optional[str]:
         """
-        保存上传的图片
+        保存上传的图片，按块流式写入磁盘（磁盘写入在线程池中执行）
+        
+        Args:
+            file: 提供 async read(size) 的上传文件对象（如 fastapi.UploadFile）
+            original_filename: 原始文件名
         
         Returns:
             保存的文件路径（相对路径），失败返回 None
@@ -62,21 +168,41 @@ class ImageService:
         if not self._is_allowed_file(original_filename):
             raise ValueError(f"不支持的文件类型，仅支持: {', '.join(ALLOWED_EXTENSIONS)}")
         
-        if len(file_content) > MAX_UPLOAD_SIZE:
-            raise ValueError(f"文件过大，最大允许 {MAX_UPLOAD_SIZE // 1024 // 1024}MB")
+        chunk = await file.read(_UPLOAD_CHUNK_SIZE)
+        
+        # 校验文件内容确实是图片，而不只是扩展名
+        if self._sniff_image_type(chunk[:12]) is None:
+            raise ValueError("文件内容不是有效的图片")
         
         # 生成文件名和路径
         new_filename = self._generate_filename(original_filename)
         file_path = os.path.join(UPLOAD_DIR, new_filename)
         
-        # 保存文件
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        # 先写暂存文件，完整写完后再放到目标路径，避免半个文件被访问到
+        out, tmp_path = await asyncio.to_thread(_open_staging_file, file_path)
+        try:
+            size = 0
+            while chunk:
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise ValueError(f"文件过大，最大允许 {MAX_UPLOAD_SIZE // 1024 // 1024}MB")
+                await asyncio.to_thread(out.write, chunk)
+                chunk = await file.read(_UPLOAD_CHUNK_SIZE)
+            await asyncio.to_thread(_publish_staging_file, out, tmp_path, file_path)
+        except BaseException:
+            out.close()
+            if tmp_path:
+                os.unlink(tmp_path)
+            raise
         
         # 返回相对路径（用于前端访问）
         return f"uploads/{new_filename}"
     
-    def analyze_image(self, image_path: str, item_type: str = "物品") -> str:
+    async def analyze_image(self, image_path: str, item_type: str = "物品") -> str:
+        """使用 Qwen-VL 分析图片（读取、编码和 API 调用均在线程池中执行）"""
+        return await asyncio.to_thread(self.analyze_image_sync, image_path, item_type)
+    
+    def analyze_image_sync(self, image_path: str, item_type: str = "物品") -> str:
         """
         使用 Qwen-VL 分析图片，返回物品描述
         
@@ -97,13 +223,23 @@ class ImageService:
             else:
                 abs_path = image_path
             
-            # 读取图片并转为 base64
             with open(abs_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode()
+                raw = f.read()
             
-            # 获取图片格式
-            ext = self._get_file_extension(abs_path)
-            mime_type = f"image/{ext}" if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp'] else "image/jpeg"
+            cache_key = (blake2b(raw, digest_size=16).digest(), item_type)
+            with _DESCRIPTION_CACHE_LOCK:
+                cached = _DESCRIPTION_CACHE.get(cache_key)
+            if cached is not None:
+                logger.debug("[ImageService] 命中识别缓存: %s...", cached[:100])
+                return cached
+            
+            if PUBLIC_BASE_URL and not os.path.isabs(image_path):
+                # 服务可公网访问时直接传图片 URL，由 Qwen-VL 自行下载
+                image_url = f"{PUBLIC_BASE_URL}/static/{image_path}"
+            else:
+                # 读取图片并转为 base64
+                mime_type = _EXT_TO_MIME.get(self._get_file_extension(abs_path), "image/jpeg")
+                image_url = f"data:{mime_type};base64,{base64.b64encode(raw).decode('ascii')}"
             
             # 调用 Qwen-VL
             response = self.client.chat.completions.create(
@@ -126,7 +262,7 @@ class ImageService:
                         },
                         {
                             "type": "image_url", 
-                            "image_url": {"url": f"data:{mime_type};base64,{image_data}"}
+                            "image_url": {"url": image_url}
                         }
                     ]
                 }],
@@ -134,11 +270,13 @@ class ImageService:
             )
             
             description = response.choices[0].message.content
-            print(f"[ImageService] AI 识别结果: {description[:100]}...")
+            logger.debug("[ImageService] AI 识别结果: %s...", description[:100])
+            with _DESCRIPTION_CACHE_LOCK:
+                _DESCRIPTION_CACHE[cache_key] = description
             return description
             
         except Exception as e:
-            print(f"[ImageService] 识别失败: {e}")
+            logger.warning("[ImageService] 识别失败: %s", e)
             return self._mock_analyze(image_path)
     
     def _mock_analyze(self, image_path: str) -> str:
@@ -146,21 +284,39 @@ class ImageService:
         return "（图片识别服务暂不可用，请手动填写物品描述）"
     
     def get_image_thumbnail(self, image_path: str, size: tuple = (200, 200)) -> Optional[bytes]:
-        """生成缩略图"""
+        """生成缩略图（结果缓存在 uploads/thumbs 目录下）"""
         try:
             if not os.path.isabs(image_path):
                 abs_path = os.path.join(os.path.dirname(UPLOAD_DIR), image_path)
             else:
                 abs_path = image_path
             
+            # 以原图路径、修改时间和尺寸作为缓存键，原图变化后自动失效
+            stat = os.stat(abs_path)
+            key = f"{abs_path}|{stat.st_mtime_ns}|{size[0]}x{size[1]}".encode("utf-8")
+            thumb_path = os.path.join(THUMB_DIR, f"{blake2b(key, digest_size=16).hexdigest()}.jpg")
+            if os.path.exists(thumb_path):
+                with open(thumb_path, 'rb') as f:
+                    return f.read()
+            
             with Image.open(abs_path) as img:
-                img.thumbnail(size)
-                from io import BytesIO
+                # JPEG 可按 1/2、1/4、1/8 缩放解码，避免解码完整分辨率
+                img.draft('RGB', size)
+                img.thumbnail(size, Image.Resampling.LANCZOS)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
                 buffer = BytesIO()
-                img.save(buffer, format='JPEG')
-                return buffer.getvalue()
+                img.save(buffer, format='JPEG', quality=82, optimize=True, progressive=True)
+            
+            data = buffer.getvalue()
+            os.makedirs(THUMB_DIR, exist_ok=True)
+            tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, thumb_path)
+            return data
         except Exception as e:
-            print(f"[ImageService] 缩略图生成失败: {e}")
+            logger.warning("[ImageService] 缩略图生成失败: %s", e)
             return None
 
 
@@ -12,3 +12,20 @@ ALTER DATABASE lost_and_found CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 -- ALTER TABLE negotiation_sessions MODIFY COLUMN status VARCHAR(30);
 -- ALTER TABLE return_schedules ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'PENDING';
 -- ALTER TABLE return_schedules ADD COLUMN IF NOT EXISTS reject_reason TEXT;
+-- ALTER TABLE items ADD COLUMN IF NOT EXISTS updated_at DATETIME;
+-- ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at DATETIME;
+-- ALTER TABLE conversations ADD COLUMN IF NOT EXISTS session_id INT NULL,
+--     ADD INDEX ix_conversations_session_id (session_id),
+--     ADD FOREIGN KEY (session_id) REFERENCES negotiation_sessions (id);
+-- ALTER TABLE items ADD COLUMN IF NOT EXISTS title_tokens TEXT, ADD COLUMN IF NOT EXISTS desc_tokens TEXT,
+--     ADD COLUMN IF NOT EXISTS ai_desc_tokens TEXT, ADD COLUMN IF NOT EXISTS location_tokens TEXT;
+
+-- 已有数据库补建查询索引（新库由 SQLAlchemy 自动创建）
+-- CREATE INDEX ix_item_type_status_ts ON items (type, status, timestamp DESC);
+-- CREATE INDEX ix_item_owner_ts ON items (owner_id, timestamp DESC);
+-- CREATE INDEX ix_item_type_status_owner ON items (type, status, owner_id);
+-- CREATE INDEX ix_failed_lost_found ON failed_matches (lost_item_id, found_item_id);
+-- CREATE INDEX ix_neg_lost_status ON negotiation_sessions (lost_item_id, status);
+-- CREATE INDEX ix_neg_found_status ON negotiation_sessions (found_item_id, status);
+-- CREATE INDEX ix_sched_session_status ON return_schedules (session_id, status);
+-- CREATE INDEX ix_notif_user_read_created ON notifications (user_id, is_read, created_at DESC);
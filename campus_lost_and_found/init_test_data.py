@@ -3,19 +3,22 @@
 运行方式: python init_test_data.py
 """
 
-from models import Base, engine, User, Item, ItemType, ItemStatus
-from sqlalchemy.orm import Session
+from models import Base, engine, SessionLocal, User, Item, ItemType, ItemStatus
+from auth import get_password_hash
+from sqlalchemy import insert, select
 
 # 创建表
 Base.metadata.create_all(bind=engine)
 
-# 测试数据
+# 测试数据（所有测试用户的密码均为 TEST_PASSWORD）
+TEST_PASSWORD = "123456"
+
 test_users = [
-    {"name": "张三", "contact_info": "13800001111"},
-    {"name": "李四", "contact_info": "13900002222"},
-    {"name": "王五", "contact_info": "15000003333"},
-    {"name": "赵六", "contact_info": "18600004444"},
-    {"name": "钱七", "contact_info": "13700005555"},
+    {"username": "zhangsan", "name": "张三", "contact_info": "13800001111"},
+    {"username": "lisi", "name": "李四", "contact_info": "13900002222"},
+    {"username": "wangwu", "name": "王五", "contact_info": "15000003333"},
+    {"username": "zhaoliu", "name": "赵六", "contact_info": "18600004444"},
+    {"username": "qianqi", "name": "钱七", "contact_info": "13700005555"},
 ]
 
 test_items = [
@@ -45,7 +48,7 @@ test_items = [
 ]
 
 def init_data():
-    db = Session(bind=engine)
+    db = SessionLocal()
     
     try:
         # 检查是否已有数据
@@ -54,25 +57,29 @@ def init_data():
             print(f"数据库中已有 {existing_users} 个用户，跳过初始化")
             return
         
-        # 创建用户
-        users = []
-        for user_data in test_users:
-            user = User(**user_data)
-            db.add(user)
-            users.append(user)
+        # 批量创建用户（单条多行 INSERT）
+        password_hash = get_password_hash(TEST_PASSWORD)
+        db.execute(insert(User), [{**user_data, "password_hash": password_hash} for user_data in test_users])
         
-        db.flush()  # 获取用户ID
+        # 按用户名取回用户ID（MySQL 不支持 INSERT ... RETURNING）
+        usernames = [user_data["username"] for user_data in test_users]
+        user_ids = dict(db.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
         
-        # 创建物品
-        for item_data in test_items:
-            owner_idx = item_data.pop("owner_idx")
-            item = Item(**item_data, owner_id=users[owner_idx].id)
-            db.add(item)
+        # 批量创建物品
+        item_rows = [
+            {
+                **{k: v for k, v in item_data.items() if k != "owner_idx"},
+                "status": ItemStatus.OPEN,
+                "owner_id": user_ids[test_users[item_data["owner_idx"]]["username"]]
+            }
+            for item_data in test_items
+        ]
+        db.execute(insert(Item), item_rows)
         
         db.commit()
         
         print("✅ 测试数据初始化成功！")
-        print(f"   - 创建了 {len(users)} 个用户")
+        print(f"   - 创建了 {len(test_users)} 个用户（密码均为 {TEST_PASSWORD}）")
         print(f"   - 创建了 {len(test_items)} 个物品")
         print()
         print("📋 物品列表:")
@@ -2,40 +2,101 @@
 校园失物招领系统 V2.0 API
 FastAPI 应用入口
 """
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, update, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload, joinedload, defer
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+from hashlib import blake2b
+import asyncio
+import logging
 import os
+import orjson as json
 
 from models import (
-    Base, engine, User, Item, ItemType, ItemStatus, ItemImage,
-    NegotiationSession, NegotiationStatus, Notification, ReturnSchedule
+    init_db, SessionLocal, AsyncSessionLocal, User, Item, ItemType, ItemStatus, ItemImage, ItemVector,
+    NegotiationSession, NegotiationStatus, NegotiationMessage, FailedMatch, Notification, NotificationType, ReturnSchedule,
+    Conversation, Turn, Job
 )
 from auth import (
     AuthService, UserRegister, UserLogin, Token, UserResponse,
     get_current_user, get_current_user_optional, TokenData
 )
-from services import MatchService, NegotiationService, NotificationService, BackgroundTaskService
+from services import MatchService, NegotiationService, NotificationService
 from image_service import image_service
-from config import UPLOAD_DIR
+from tasks import submit_analyze, submit_matching, submit_refit_vectorizer
+from config import UPLOAD_DIR, AUTO_CREATE_DB, FRONTEND_ORIGIN, TFIDF_REFIT_EVERY
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="校园失物招领系统 V2.0", version="2.0.0")
+# 本地开发时自动建表；生产环境由部署步骤执行一次 init_db，避免每个 worker 启动时都检查表结构
+if AUTO_CREATE_DB:
+    init_db()
 
-# CORS
+app = FastAPI(title="校园失物招领系统 V2.0", version="2.0.0", default_response_class=ORJSONResponse)
+
+
+@app.on_event("startup")
+async def log_event_loop():
+    """记录实际使用的事件循环，生产环境应为 uvloop.Loop"""
+    loop = asyncio.get_running_loop()
+    logger.info("[Startup] Event loop: %s.%s", type(loop).__module__, type(loop).__qualname__)
+
+
+# 请求返回后仍在执行的后台协程（持有引用，避免被回收）
+_BACKGROUND_TASKS = set()
+
+
+def spawn(coro):
+    """在事件循环中后台执行协程，不阻塞当前请求"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+def _on_background_task_done(task: asyncio.Task):
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("[Background] Task failed: %r", task.exception())
+
+
+@app.on_event("shutdown")
+async def wait_background_tasks():
+    """关闭前等待未完成的后台协程（如通知写入）"""
+    if _BACKGROUND_TASKS:
+        await asyncio.gather(*_BACKGROUND_TASKS, return_exceptions=True)
+
+
+class UploadAwareGZipMiddleware(GZipMiddleware):
+    """GZip 压缩响应；上传的图片本身已是压缩格式，直接跳过"""
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/static/uploads/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# 响应压缩（小于 1KB 的响应不压缩）
+app.add_middleware(UploadAwareGZipMiddleware, minimum_size=1024)
+
+# CORS（最后注册即最外层，预检请求不再经过压缩等中间件）
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=FRONTEND_ORIGIN,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE"],
+    allow_headers=["authorization", "content-type", "if-none-match"],
+    expose_headers=["etag"],
+    max_age=600,
 )
 
 # 静态文件
@@ -47,21 +108,27 @@ if os.path.exists(static_dir):
 # ==================== 健康检查 ====================
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """健康检查端点（用于 Docker 健康检查）"""
-    return {"status": "healthy", "version": "2.0.0"}
+    return ORJSONResponse({"status": "healthy", "version": "2.0.0"})
 
 
 # ==================== 数据库依赖 ====================
 
 def get_db():
-    db = Session(bind=engine)
+    db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 
+async def get_async_db():
+    """只读接口使用的异步会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # ==================== Pydantic 模型 ====================
 
 class ItemCreate(BaseModel):
@@ -93,6 +160,7 @@ class ScheduleCreate(BaseModel):
 
 
 # ==================== 认证接口 ====================
+# 注册/登录会做同步数据库查询和 CPU 密集的密码哈希，定义为普通函数，由 FastAPI 放到线程池执行
 
 @app.post("/auth/register", response_model=UserResponse)
 def register(user_data: UserRegister, db: Session = Depends(get_db)):
@@ -133,7 +201,7 @@ def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
 @app.get("/auth/me", response_model=UserResponse)
 def get_me(current_user: TokenData = Depends(get_current_user), db: Session = Depends(get_db)):
     """获取当前用户信息"""
-    user = db.query(User).get(current_user.user_id)
+    user = db.get(User, current_user.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     return UserResponse(
@@ -149,32 +217,47 @@ def get_me(current_user: TokenData = Depends(get_current_user), db: Session = De
 @app.post("/images/upload")
 async def upload_image(file: UploadFile = File(...)):
     """上传图片"""
-    content = await file.read()
     try:
-        path = image_service.save_image(content, file.filename)
+        # 分块流式写盘，不把整个文件读入内存
+        path = await image_service.save_image(file, file.filename)
         return {"path": path, "url": f"/static/{path}"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.post("/images/analyze")
+@app.post("/images/analyze", status_code=202)
 async def analyze_image(file: UploadFile = File(...), item_type: str = Form("物品")):
-    """上传图片并识别"""
-    content = await file.read()
+    """上传图片并提交识别任务，识别结果通过 /jobs/{job_id} 查询"""
     try:
         # 保存图片
-        path = image_service.save_image(content, file.filename)
-        
-        # 识别图片
-        description = image_service.analyze_image(path, item_type)
-        
-        return {
-            "path": path,
-            "url": f"/static/{path}",
-            "ai_description": description
-        }
+        path = await image_service.save_image(file, file.filename)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    
+    # 识别图片（后台执行）
+    job_id = await asyncio.to_thread(submit_analyze, path, item_type)
+    
+    return {
+        "job_id": job_id,
+        "path": path,
+        "url": f"/static/{path}"
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """查询后台任务状态，完成后 result 中包含任务结果（如识别结果）"""
+    job = await db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {
+        "job_id": job.id,
+        "type": job.type,
+        "status": job.status.value,
+        "result": job.result,
+        "error": job.error,
+        "item_id": job.item_id
+    }
 
 
 # ==================== 物品接口 ====================
@@ -183,13 +266,10 @@ async def analyze_image(file: UploadFile = File(...), item_type: str = Form("物
 def create_item(
     item: ItemCreate,
     image_paths: Optional[str] = None,  # 改为字符串，从查询参数接收 JSON
-    background_tasks: BackgroundTasks = None,
     current_user: TokenData = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """创建物品"""
-    import json
-    
     # 解析图片路径
     parsed_image_paths = []
     if image_paths:
@@ -208,89 +288,171 @@ def create_item(
         location=item.location,
         owner_id=current_user.user_id
     )
+    match_service = MatchService(db)
+    match_service.update_tokens(db_item)
     db.add(db_item)
     db.flush()
+    match_service.store_vector(db_item)
     
-    # 添加图片
+    # 添加图片（单条多行 INSERT）
     if parsed_image_paths:
-        for path in parsed_image_paths:
-            img = ItemImage(item_id=db_item.id, image_path=path)
-            db.add(img)
+        db.execute(insert(ItemImage), [
+            {"item_id": db_item.id, "image_path": path} for path in parsed_image_paths
+        ])
     
     db.commit()
     db.refresh(db_item)
     
-    # 如果是丢失物品，触发后台匹配
-    if db_item.type == ItemType.LOST and background_tasks:
-        background_tasks.add_task(
-            run_background_matching,
-            db_item.id
-        )
+    # 物品每增加一定数量，后台重新拟合全局 TF-IDF 模型
+    if db_item.id % TFIDF_REFIT_EVERY == 0:
+        submit_refit_vectorizer()
+    
+    # 如果是丢失物品，提交后台匹配任务
+    job_id = None
+    if db_item.type == ItemType.LOST:
+        job_id = submit_matching(db_item.id)
     
-    return {"id": db_item.id, "message": "物品发布成功"}
+    return {"id": db_item.id, "job_id": job_id, "message": "物品发布成功"}
+
+
+# 列表接口的客户端缓存：轮询方短时间内直接复用，过期后先用旧数据再后台校验；
+# 前端列表页用 cache: 'no-cache' 请求，每次都按 ETag 校验
+ITEMS_CACHE_CONTROL = "private, max-age=5, stale-while-revalidate=30"
+
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
 
-@app.get("/items/")
-def get_items(
+
+# 列表分页：按主键倒序的游标分页，每页默认 50 条
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _page(content: list, limit: int) -> dict:
+    """包装一页结果；取满一页时用最后一条的 id 作为下一页游标"""
+    return {"items": content, "next_cursor": content[-1]["id"] if len(content) == limit else None}
+
+
+async def _image_urls_by_item(db: AsyncSession, item_ids: List[int]) -> dict:
+    """一次查询取回多个物品的图片地址，按 item_id 分组"""
+    images = {}
+    if not item_ids:
+        return images
+    rows = await db.execute(
+        select(ItemImage.item_id, ItemImage.image_path)
+        .where(ItemImage.item_id.in_(item_ids)).order_by(ItemImage.id)
+    )
+    for item_id, image_path in rows:
+        images.setdefault(item_id, []).append(f"/static/{image_path}")
+    return images
+
+
+@app.get("/items/", response_class=ORJSONResponse)
+async def get_items(
+    request: Request,
     type: Optional[str] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取物品列表"""
-    query = db.query(Item)
-    
+    """获取物品列表（游标分页，支持 ETag / If-None-Match 条件请求）"""
+    filters = []
     if type:
-        query = query.filter(Item.type == ItemType[type])
+        filters.append(Item.type == ItemType[type])
     if status:
-        query = query.filter(Item.status == ItemStatus[status])
-    
-    items = query.order_by(Item.timestamp.desc()).all()
-    
-    return [
+        filters.append(Item.status == ItemStatus[status])
+    
+    # 物品和发布者的最近更新时间 + 行数作为列表版本，未变化时直接返回 304，不查询和序列化列表；
+    # 旧数据的 updated_at 可能为空，用发布时间兜底
+    last_updated, owner_updated, count = (await db.execute(
+        select(
+            func.max(func.coalesce(Item.updated_at, Item.timestamp)),
+            func.max(User.updated_at),
+            func.count(Item.id)
+        ).outerjoin(User, User.id == Item.owner_id).where(*filters)
+    )).one()
+    # 不同游标和页大小返回的是不同的页，也要区分版本
+    version = f"{last_updated}|{owner_updated}|{count}|{cursor}|{limit}"
+    etag = '"' + blake2b(version.encode(), digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": ITEMS_CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    # 只查询需要的列，返回轻量 Row，不构造 Item 对象
+    if cursor is not None:
+        filters.append(Item.id < cursor)
+    rows = (await db.execute(
+        select(
+            Item.id, Item.title, Item.description, Item.ai_description, Item.type, Item.status,
+            Item.location, Item.owner_id, User.name.label("owner_name"), Item.timestamp
+        ).outerjoin(User, User.id == Item.owner_id).where(*filters)
+        .order_by(Item.id.desc()).limit(limit)
+    )).all()
+    images = await _image_urls_by_item(db, [row.id for row in rows])
+    
+    return ORJSONResponse(headers=headers, content=_page([
         {
-            "id": item.id,
-            "title": item.title,
-            "description": item.description,
-            "ai_description": item.ai_description,
-            "type": item.type.value,
-            "status": item.status.value,
-            "location": item.location,
-            "owner_id": item.owner_id,
-            "owner_name": item.owner.name if item.owner else None,
-            "images": [f"/static/{img.image_path}" for img in item.images],
-            "created_at": item.timestamp.isoformat() if item.timestamp else None
+            "id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "ai_description": row.ai_description,
+            "type": row.type.value,
+            "status": row.status.value,
+            "location": row.location,
+            "owner_id": row.owner_id,
+            "owner_name": row.owner_name,
+            "images": images.get(row.id, []),
+            "created_at": row.timestamp.isoformat() if row.timestamp else None
         }
-        for item in items
-    ]
+        for row in rows
+    ], limit))
 
 
-@app.get("/items/my")
-def get_my_items(
+@app.get("/items/my", response_class=ORJSONResponse)
+async def get_my_items(
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取我的物品"""
-    items = db.query(Item).filter(Item.owner_id == current_user.user_id).order_by(Item.timestamp.desc()).all()
-    
-    return [
+    """获取我的物品（游标分页）"""
+    query = select(
+        Item.id, Item.title, Item.description, Item.type, Item.status, Item.location, Item.timestamp
+    ).where(Item.owner_id == current_user.user_id)
+    if cursor is not None:
+        query = query.where(Item.id < cursor)
+    rows = (await db.execute(query.order_by(Item.id.desc()).limit(limit))).all()
+    images = await _image_urls_by_item(db, [row.id for row in rows])
+    
+    return ORJSONResponse(_page([
         {
-            "id": item.id,
-            "title": item.title,
-            "description": item.description,
-            "type": item.type.value,
-            "status": item.status.value,
-            "location": item.location,
-            "images": [f"/static/{img.image_path}" for img in item.images],
-            "created_at": item.timestamp.isoformat() if item.timestamp else None
+            "id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "type": row.type.value,
+            "status": row.status.value,
+            "location": row.location,
+            "images": images.get(row.id, []),
+            "created_at": row.timestamp.isoformat() if row.timestamp else None
         }
-        for item in items
-    ]
+        for row in rows
+    ], limit))
 
 
 @app.get("/items/{item_id}")
-def get_item(item_id: int, db: Session = Depends(get_db)):
+async def get_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取物品详情"""
-    item = db.query(Item).get(item_id)
+    item = await db.scalar(
+        select(Item).options(
+            joinedload(Item.owner), selectinload(Item.images).load_only(ItemImage.image_path)
+        ).where(Item.id == item_id)
+    )
     if not item:
         raise HTTPException(status_code=404, detail="物品不存在")
     
@@ -312,6 +474,14 @@ def get_item(item_id: int, db: Session = Depends(get_db)):
     }
 
 
+def _delete_conversations(db: Session, item_ids: List[int]):
+    """删除涉及这些物品的 Agent 对话日志及其轮次"""
+    conversation_filter = Conversation.lost_item_id.in_(item_ids) | Conversation.found_item_id.in_(item_ids)
+    conversation_ids = db.query(Conversation.id).filter(conversation_filter).subquery()
+    db.query(Turn).filter(Turn.conv_id.in_(select(conversation_ids.c.id))).delete(synchronize_session=False)
+    db.query(Conversation).filter(conversation_filter).delete(synchronize_session=False)
+
+
 @app.delete("/items/{item_id}")
 def delete_item(
     item_id: int,
@@ -319,7 +489,7 @@ def delete_item(
     db: Session = Depends(get_db)
 ):
     """删除物品"""
-    item = db.query(Item).get(item_id)
+    item = db.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="物品不存在")
     
@@ -327,7 +497,6 @@ def delete_item(
         raise HTTPException(status_code=403, detail="无权删除他人的物品")
     
     # 检查是否有进行中的协商
-    from models import NegotiationSession, NegotiationStatus
     active_sessions = db.query(NegotiationSession).filter(
         ((NegotiationSession.lost_item_id == item_id) | (NegotiationSession.found_item_id == item_id)),
         NegotiationSession.status.in_([NegotiationStatus.ACTIVE, NegotiationStatus.PENDING_CONFIRM])
@@ -337,29 +506,32 @@ def delete_item(
         raise HTTPException(status_code=400, detail="该物品有进行中的协商，无法删除")
     
     # 先删除关联记录
-    from models import FailedMatch, Notification
-    
     # 删除失败匹配记录
     db.query(FailedMatch).filter(
         (FailedMatch.lost_item_id == item_id) | (FailedMatch.found_item_id == item_id)
     ).delete(synchronize_session=False)
     
-    # 删除已完成的协商会话
-    completed_sessions = db.query(NegotiationSession).filter(
-        (NegotiationSession.lost_item_id == item_id) | (NegotiationSession.found_item_id == item_id)
-    ).all()
-    
-    from models import ReturnSchedule
-    
-    for session in completed_sessions:
-        # 删除归还约定
-        db.query(ReturnSchedule).filter(ReturnSchedule.session_id == session.id).delete(synchronize_session=False)
-        # 删除相关通知
-        db.query(Notification).filter(Notification.related_session_id == session.id).delete(synchronize_session=False)
-        db.delete(session)
-    
-    # 删除物品
-    db.delete(item)
+    # 删除已完成的协商会话及其归还约定、通知（按集合删除，语句数与会话数无关）
+    session_filter = (NegotiationSession.lost_item_id == item_id) | (NegotiationSession.found_item_id == item_id)
+    session_ids = db.query(NegotiationSession.id).filter(session_filter).subquery()
+    db.query(ReturnSchedule).filter(
+        ReturnSchedule.session_id.in_(select(session_ids.c.id))
+    ).delete(synchronize_session=False)
+    db.query(Notification).filter(
+        Notification.related_session_id.in_(select(session_ids.c.id))
+    ).delete(synchronize_session=False)
+    db.query(NegotiationMessage).filter(
+        NegotiationMessage.session_id.in_(select(session_ids.c.id))
+    ).delete(synchronize_session=False)
+    # 对话日志引用会话和物品，需先于会话删除
+    _delete_conversations(db, [item_id])
+    # MySQL 不允许 DELETE 的子查询引用被删除的表，这里直接用条件删除
+    db.query(NegotiationSession).filter(session_filter).delete(synchronize_session=False)
+    
+    # 删除物品及其图片、向量
+    db.query(ItemImage).filter(ItemImage.item_id == item_id).delete(synchronize_session=False)
+    db.query(ItemVector).filter(ItemVector.item_id == item_id).delete(synchronize_session=False)
+    db.query(Item).filter(Item.id == item_id).delete(synchronize_session=False)
     db.commit()
     
     return {"message": "物品已删除"}
@@ -380,7 +552,7 @@ def update_item(
     db: Session = Depends(get_db)
 ):
     """更新物品信息"""
-    item = db.query(Item).get(item_id)
+    item = db.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="物品不存在")
     
@@ -394,6 +566,9 @@ def update_item(
         item.description = item_update.description
     if item_update.location is not None:
         item.location = item_update.location
+    match_service = MatchService(db)
+    match_service.update_tokens(item)
+    match_service.store_vector(item)
     
     db.commit()
     db.refresh(item)
@@ -404,12 +579,11 @@ def update_item(
 @app.post("/items/{item_id}/match")
 def trigger_matching(
     item_id: int,
-    background_tasks: BackgroundTasks,
     current_user: TokenData = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """手动触发匹配"""
-    item = db.query(Item).get(item_id)
+    item = db.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="物品不存在")
     
@@ -419,27 +593,35 @@ def trigger_matching(
     if item.type != ItemType.LOST:
         raise HTTPException(status_code=400, detail="只有丢失物品可以触发匹配")
     
-    # 触发后台匹配
-    background_tasks.add_task(run_background_matching, item_id)
+    # 提交后台匹配任务
+    job_id = submit_matching(item_id)
     
-    return {"message": "匹配任务已启动，请等待通知"}
+    return {"message": "匹配任务已启动，请等待通知", "job_id": job_id}
 
 
 # ==================== 协商接口 ====================
 
-@app.get("/negotiations/")
-def get_my_negotiations(
+@app.get("/negotiations/", response_class=ORJSONResponse)
+async def get_my_negotiations(
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取我相关的协商会话"""
-    # 查询我作为失主或拾主的会话
-    sessions = db.query(NegotiationSession).join(
-        Item, 
-        (NegotiationSession.lost_item_id == Item.id) | (NegotiationSession.found_item_id == Item.id)
-    ).filter(Item.owner_id == current_user.user_id).all()
-    
-    return [
+    """获取我相关的协商会话（游标分页）"""
+    # 查询我作为失主或拾主的会话（用子查询代替 JOIN，避免重复行影响 LIMIT）
+    my_item_ids = select(Item.id).where(Item.owner_id == current_user.user_id)
+    query = select(NegotiationSession).options(
+        joinedload(NegotiationSession.lost_item), joinedload(NegotiationSession.found_item)
+    ).where(or_(
+        NegotiationSession.lost_item_id.in_(my_item_ids),
+        NegotiationSession.found_item_id.in_(my_item_ids)
+    ))
+    if cursor is not None:
+        query = query.where(NegotiationSession.id < cursor)
+    sessions = (await db.scalars(query.order_by(NegotiationSession.id.desc()).limit(limit))).all()
+    
+    return ORJSONResponse(_page([
         {
             "id": s.id,
             "status": s.status.value,
@@ -449,18 +631,32 @@ def get_my_negotiations(
             "created_at": s.created_at.isoformat() if s.created_at else None
         }
         for s in sessions
-    ]
+    ], limit))
 
 
 @app.get("/negotiations/{session_id}")
-def get_negotiation(session_id: int, db: Session = Depends(get_db)):
+async def get_negotiation(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取协商详情"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = await db.scalar(
+        select(NegotiationSession).options(
+            joinedload(NegotiationSession.lost_item), joinedload(NegotiationSession.found_item),
+            selectinload(NegotiationSession.messages)
+        ).where(NegotiationSession.id == session_id)
+    )
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
+    # 聊天记录（旧数据没有消息行时使用 chat_log 字段）
+    chat_log = [
+        {"sender": m.sender, "content": m.content, "action_type": m.action_type}
+        for m in session.messages
+    ] or session.chat_log or []
+    
     # 获取约定信息
-    schedule = db.query(ReturnSchedule).filter(ReturnSchedule.session_id == session_id).order_by(ReturnSchedule.created_at.desc()).first()
+    schedule = await db.scalar(
+        select(ReturnSchedule).where(ReturnSchedule.session_id == session_id)
+        .order_by(ReturnSchedule.created_at.desc()).limit(1)
+    )
     schedule_info = None
     if schedule:
         schedule_info = {
@@ -476,7 +672,7 @@ def get_negotiation(session_id: int, db: Session = Depends(get_db)):
         "id": session.id,
         "status": session.status.value,
         "match_score": session.match_score,
-        "chat_log": session.chat_log,
+        "chat_log": chat_log,
         "lost_item": {
             "id": session.lost_item.id,
             "title": session.lost_item.title,
@@ -504,7 +700,7 @@ def confirm_item(
     db: Session = Depends(get_db)
 ):
     """确认是否是自己的物品"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = db.get(NegotiationSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -556,7 +752,11 @@ def force_match(
     db: Session = Depends(get_db)
 ):
     """强制将失败的协商标记为成功（用户确认是自己的物品）"""
-    session = db.query(NegotiationSession).get(session_id)
+    # 权限检查只需要失主，不加载聊天记录
+    session = db.get(
+        NegotiationSession, session_id,
+        options=[defer(NegotiationSession.chat_log), joinedload(NegotiationSession.lost_item)]
+    )
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -565,23 +765,27 @@ def force_match(
         raise HTTPException(status_code=403, detail="只有失主可以强制匹配")
     
     # 只允许对失败的会话进行强制匹配
-    if session.status not in [NegotiationStatus.FAILED, NegotiationStatus.REJECTED]:
+    failed_statuses = [NegotiationStatus.FAILED, NegotiationStatus.REJECTED]
+    if session.status not in failed_statuses:
         raise HTTPException(status_code=400, detail="只能对失败的协商进行强制匹配")
     
     # 更新状态为待确认
-    session.status = NegotiationStatus.PENDING_CONFIRM
-    session.seeker_confirmed = True
-    
-    # 添加强制匹配记录到聊天日志
-    chat_log = session.chat_log or []
-    chat_log.append({
-        "sender": "System",
-        "content": "失主确认这是自己的物品，已强制标记为匹配成功。"
-    })
-    session.chat_log = chat_log
+    result = db.execute(
+        update(NegotiationSession)
+        .where(NegotiationSession.id == session_id, NegotiationSession.status.in_(failed_statuses))
+        .values(status=NegotiationStatus.PENDING_CONFIRM, seeker_confirmed=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="只能对失败的协商进行强制匹配")
     
-    from sqlalchemy.orm.attributes import flag_modified
-    flag_modified(session, "chat_log")
+    # 添加强制匹配记录到聊天记录
+    db.add(NegotiationMessage(
+        session_id=session_id,
+        sender="System",
+        content="失主确认这是自己的物品，已强制标记为匹配成功。"
+    ))
     
     db.commit()
     
@@ -589,14 +793,18 @@ def force_match(
 
 
 @app.post("/negotiations/{session_id}/schedule")
-def create_schedule(
+async def create_schedule(
     session_id: int,
     schedule: ScheduleCreate,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建归还约定（仅拾主可发起）"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = await db.scalar(
+        select(NegotiationSession).options(
+            joinedload(NegotiationSession.lost_item), joinedload(NegotiationSession.found_item)
+        ).where(NegotiationSession.id == session_id)
+    )
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -609,9 +817,9 @@ def create_schedule(
         raise HTTPException(status_code=400, detail="当前状态不允许发起约定")
     
     # 检查是否已有待处理约定
-    existing = db.query(ReturnSchedule).filter(
-        ReturnSchedule.session_id == session_id
-    ).first()
+    existing = await db.scalar(
+        select(ReturnSchedule).where(ReturnSchedule.session_id == session_id).limit(1)
+    )
     
     if existing:
         if existing.status == "PENDING":
@@ -636,33 +844,34 @@ def create_schedule(
     # 更新会话状态
     session.status = NegotiationStatus.SCHEDULE_PENDING
     
-    db.commit()
+    await db.commit()
     
-    # 发送通知给失主
-    notification_service = NotificationService(db)
+    # 通知失主（后台发送，不阻塞响应）
     seeker_id = session.lost_item.owner_id if session.lost_item else None
-    
-    from models import NotificationType
     if seeker_id:
-        notification_service.send(
+        spawn(NotificationService.asend(
             user_id=seeker_id,
             type=NotificationType.SCHEDULE,
             title="拾主发起了归还约定",
             message=f"时间: {schedule.proposed_time}, 地点: {schedule.proposed_location}，请确认是否同意。",
             session_id=session_id
-        )
+        ))
     
     return {"message": "约定已发起，等待失主确认"}
 
 
 @app.post("/negotiations/{session_id}/schedule/approve")
-def approve_schedule(
+async def approve_schedule(
     session_id: int,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """失主同意约定"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = await db.scalar(
+        select(NegotiationSession).options(
+            joinedload(NegotiationSession.lost_item), joinedload(NegotiationSession.found_item)
+        ).where(NegotiationSession.id == session_id)
+    )
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -673,31 +882,29 @@ def approve_schedule(
     if session.status != NegotiationStatus.SCHEDULE_PENDING:
         raise HTTPException(status_code=400, detail="当前状态不允许审批约定")
     
-    # 更新约定状态
-    schedule = db.query(ReturnSchedule).filter(
-        ReturnSchedule.session_id == session_id,
-        ReturnSchedule.status == "PENDING"
-    ).first()
-    if schedule:
-        schedule.status = "APPROVED"
+    # 更新约定状态（单条 UPDATE，无需先查询）
+    await db.execute(
+        update(ReturnSchedule)
+        .where(ReturnSchedule.session_id == session_id, ReturnSchedule.status == "PENDING")
+        .values(status="APPROVED")
+        .execution_options(synchronize_session=False)
+    )
     
     # 更新会话状态
     session.status = NegotiationStatus.WAITING_RETURN
     
-    db.commit()
+    await db.commit()
     
-    # 通知拾主
-    notification_service = NotificationService(db)
+    # 通知拾主（后台发送，不阻塞响应）
     finder_id = session.found_item.owner_id if session.found_item else None
-    from models import NotificationType
     if finder_id:
-        notification_service.send(
+        spawn(NotificationService.asend(
             user_id=finder_id,
             type=NotificationType.NEGOTIATION_UPDATE,
             title="失主已同意约定",
             message="可以按约定时间地点进行归还了。",
             session_id=session_id
-        )
+        ))
     
     return {"message": "已同意约定，进入等待归还状态"}
 
@@ -707,14 +914,18 @@ class RejectRequest(BaseModel):
 
 
 @app.post("/negotiations/{session_id}/schedule/reject")
-def reject_schedule(
+async def reject_schedule(
     session_id: int,
     reject: RejectRequest,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """失主回绝约定"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = await db.scalar(
+        select(NegotiationSession).options(
+            joinedload(NegotiationSession.lost_item), joinedload(NegotiationSession.found_item)
+        ).where(NegotiationSession.id == session_id)
+    )
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -728,32 +939,29 @@ def reject_schedule(
     if not reject.reason or not reject.reason.strip():
         raise HTTPException(status_code=400, detail="回绝理由不能为空")
     
-    # 更新约定状态
-    schedule = db.query(ReturnSchedule).filter(
-        ReturnSchedule.session_id == session_id,
-        ReturnSchedule.status == "PENDING"
-    ).first()
-    if schedule:
-        schedule.status = "REJECTED"
-        schedule.reject_reason = reject.reason.strip()
+    # 更新约定状态（单条 UPDATE，无需先查询）
+    await db.execute(
+        update(ReturnSchedule)
+        .where(ReturnSchedule.session_id == session_id, ReturnSchedule.status == "PENDING")
+        .values(status="REJECTED", reject_reason=reject.reason.strip())
+        .execution_options(synchronize_session=False)
+    )
     
     # 返回 CONFIRMED 状态，允许拾主重新发起
     session.status = NegotiationStatus.CONFIRMED
     
-    db.commit()
+    await db.commit()
     
-    # 通知拾主
-    notification_service = NotificationService(db)
+    # 通知拾主（后台发送，不阻塞响应）
     finder_id = session.found_item.owner_id if session.found_item else None
-    from models import NotificationType
     if finder_id:
-        notification_service.send(
+        spawn(NotificationService.asend(
             user_id=finder_id,
             type=NotificationType.NEGOTIATION_UPDATE,
             title="约定被失主回绝",
             message=f"回绝理由: {reject.reason}，您可以重新发起约定。",
             session_id=session_id
-        )
+        ))
     
     return {"message": "已回绝约定"}
 
@@ -765,7 +973,7 @@ def start_return(
     db: Session = Depends(get_db)
 ):
     """开始等待归还（约定后调用）"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = db.get(NegotiationSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -786,7 +994,7 @@ def confirm_return(
     db: Session = Depends(get_db)
 ):
     """确认归还状态"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = db.get(NegotiationSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -831,7 +1039,6 @@ def confirm_return(
             session.found_item.status = ItemStatus.OPEN
         
         # 记录到失败匹配
-        from models import FailedMatch
         failed = FailedMatch(
             lost_item_id=session.lost_item.id if session.lost_item else None,
             found_item_id=session.found_item.id if session.found_item else None,
@@ -852,14 +1059,15 @@ def confirm_return(
         found_item_id = session.found_item.id if session.found_item else None
         
         # 先删除关联记录
-        from models import FailedMatch, Notification, ItemImage
-        
         for item_id in [lost_item_id, found_item_id]:
             if item_id:
                 db.query(FailedMatch).filter(
                     (FailedMatch.lost_item_id == item_id) | (FailedMatch.found_item_id == item_id)
                 ).delete(synchronize_session=False)
                 db.query(ItemImage).filter(ItemImage.item_id == item_id).delete(synchronize_session=False)
+        item_ids = [item_id for item_id in (lost_item_id, found_item_id) if item_id]
+        db.query(ItemVector).filter(ItemVector.item_id.in_(item_ids)).delete(synchronize_session=False)
+        _delete_conversations(db, item_ids)
         
         # 将会话的物品引用置空（避免外键约束）
         session.lost_item_id = None
@@ -885,7 +1093,7 @@ def return_failed(
     db: Session = Depends(get_db)
 ):
     """归还失败（线下确认不匹配）"""
-    session = db.query(NegotiationSession).get(session_id)
+    session = db.get(NegotiationSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -900,7 +1108,7 @@ def return_failed(
     
     # 更新会话状态
     session.status = NegotiationStatus.RETURN_FAILED
-    session.completed_at = datetime.datetime.utcnow()
+    session.completed_at = datetime.utcnow()
     
     # 恢复物品状态为 OPEN
     if session.lost_item:
@@ -909,7 +1117,6 @@ def return_failed(
         session.found_item.status = ItemStatus.OPEN
     
     # 记录到失败匹配
-    from models import FailedMatch
     failed = FailedMatch(
         lost_item_id=session.lost_item.id if session.lost_item else None,
         found_item_id=session.found_item.id if session.found_item else None,
@@ -924,17 +1131,23 @@ def return_failed(
 
 # ==================== 通知接口 ====================
 
-@app.get("/notifications/")
-def get_notifications(
+@app.get("/notifications/", response_class=ORJSONResponse)
+async def get_notifications(
     unread_only: bool = False,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取我的通知"""
-    service = NotificationService(db)
-    notifications = service.get_user_notifications(current_user.user_id, unread_only)
-    
-    return [
+    """获取我的通知（游标分页）"""
+    query = select(Notification).where(Notification.user_id == current_user.user_id)
+    if unread_only:
+        query = query.where(Notification.is_read == False)
+    if cursor is not None:
+        query = query.where(Notification.id < cursor)
+    notifications = (await db.scalars(query.order_by(Notification.id.desc()).limit(limit))).all()
+    
+    return ORJSONResponse(_page([
         {
             "id": n.id,
             "type": n.type.value,
@@ -945,7 +1158,7 @@ def get_notifications(
             "created_at": n.created_at.isoformat() if n.created_at else None
         }
         for n in notifications
-    ]
+    ], limit))
 
 
 @app.post("/notifications/{notification_id}/read")
@@ -960,18 +1173,6 @@ def mark_notification_read(
     return {"message": "已标记为已读"}
 
 
-# ==================== 后台任务 ====================
-
-def run_background_matching(item_id: int):
-    """后台执行匹配任务"""
-    db = Session(bind=engine)
-    try:
-        service = BackgroundTaskService(db)
-        service.run_auto_matching(item_id)
-    finally:
-        db.close()
-
-
 # ==================== 健康检查 ====================
 
 @app.get("/health")
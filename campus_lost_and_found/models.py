@@ -2,11 +2,15 @@
 数据库模型定义
 支持 MySQL 和 SQLite（备用）
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, JSON, Boolean, Float
-from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, LargeBinary, ForeignKey, DateTime, Enum, JSON, Boolean, Float, Index
+)
+from sqlalchemy.orm import relationship, declarative_base, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import datetime
 import enum
+import logging
 
 from config import DATABASE_URL, USE_SQLITE, SQLITE_URL
 
@@ -61,6 +65,7 @@ class User(Base):
     name = Column(String(100), nullable=False)
     contact_info = Column(String(200), nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     # 关系
     items = relationship("Item", back_populates="owner")
@@ -81,12 +86,26 @@ class Item(Base):
     status = Column(Enum(ItemStatus), default=ItemStatus.OPEN)
     location = Column(String(200))
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    # 分词结果缓存（空格分隔），发布/编辑物品时写入，匹配时直接使用
+    title_tokens = Column(Text, nullable=True)
+    desc_tokens = Column(Text, nullable=True)
+    ai_desc_tokens = Column(Text, nullable=True)
+    location_tokens = Column(Text, nullable=True)
     
     owner_id = Column(Integer, ForeignKey('users.id'))
     owner = relationship("User", back_populates="items")
     
-    # 图片关联
-    images = relationship("ItemImage", back_populates="item", cascade="all, delete-orphan")
+    # 图片关联（匹配/协商流程不需要图片，需要时显式 selectinload，误触发懒加载直接报错）
+    images = relationship("ItemImage", back_populates="item", cascade="all, delete-orphan", lazy="raise")
+
+
+# 物品列表按类型/状态筛选、我的物品按用户筛选，均按时间倒序
+Index('ix_item_type_status_ts', Item.type, Item.status, Item.timestamp.desc())
+Index('ix_item_owner_ts', Item.owner_id, Item.timestamp.desc())
+# 匹配候选按类型/状态筛选并排除自己发布的物品
+Index('ix_item_type_status_owner', Item.type, Item.status, Item.owner_id)
 
 
 class ItemImage(Base):
@@ -101,6 +120,15 @@ class ItemImage(Base):
     item = relationship("Item", back_populates="images")
 
 
+class ItemVector(Base):
+    """物品 TF-IDF 向量表（用全局模型预先计算，匹配时直接读取）"""
+    __tablename__ = 'item_vectors'
+    
+    item_id = Column(Integer, ForeignKey('items.id'), primary_key=True)
+    model_version = Column(BigInteger, nullable=False)  # 计算时全局模型文件的修改时间（纳秒），模型更新后旧向量失效
+    vec = Column(LargeBinary, nullable=False)  # scipy.sparse CSR 矩阵（npz 格式），每个匹配字段一行
+
+
 # ==================== 协商模型 ====================
 
 class NegotiationSession(Base):
@@ -114,7 +142,7 @@ class NegotiationSession(Base):
     
     status = Column(Enum(NegotiationStatus), default=NegotiationStatus.ACTIVE)
     match_score = Column(Float, default=0.0)  # 匹配度分数
-    chat_log = Column(JSON, default=list)
+    chat_log = Column(JSON, default=list)  # 旧版聊天记录，新消息逐条写入 negotiation_messages
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
@@ -128,6 +156,31 @@ class NegotiationSession(Base):
     
     # 归还约定
     return_schedule = relationship("ReturnSchedule", back_populates="session", uselist=False)
+    
+    # 聊天记录（需要时显式 selectinload）
+    messages = relationship("NegotiationMessage", order_by="NegotiationMessage.id", lazy="raise")
+
+
+# 按物品查找进行中的协商（失主、拾主两侧各一个）
+Index('ix_neg_lost_status', NegotiationSession.lost_item_id, NegotiationSession.status)
+Index('ix_neg_found_status', NegotiationSession.found_item_id, NegotiationSession.status)
+
+
+class NegotiationMessage(Base):
+    """协商聊天记录表，每条消息一行，只追加不修改"""
+    __tablename__ = 'negotiation_messages'
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey('negotiation_sessions.id'), nullable=False)
+    round_num = Column(Integer, nullable=True)  # 协商轮次，系统消息为空
+    sender = Column(String(20), nullable=False)  # Seeker / Finder / System
+    content = Column(Text, nullable=True)
+    action_type = Column(String(20), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+# 按会话顺序读取聊天记录
+Index('ix_neg_msg_session', NegotiationMessage.session_id, NegotiationMessage.id)
 
 
 class FailedMatch(Base):
@@ -142,6 +195,64 @@ class FailedMatch(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 
+# 匹配时按丢失物品查已失败的拾取物品
+Index('ix_failed_lost_found', FailedMatch.lost_item_id, FailedMatch.found_item_id)
+
+
+# ==================== 对话日志模型 ====================
+
+class Conversation(Base):
+    """Agent 对话表（一次协商对应一条）"""
+    __tablename__ = 'conversations'
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey('negotiation_sessions.id'), nullable=True, index=True)
+    lost_item_id = Column(Integer, ForeignKey('items.id'))
+    found_item_id = Column(Integer, ForeignKey('items.id'))
+    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    turns = relationship("Turn", back_populates="conversation", order_by="Turn.idx")
+
+
+class Turn(Base):
+    """Agent 对话轮次表，记录每一次 LLM 决策，用于重放和恢复 Agent 记忆"""
+    __tablename__ = 'conversation_turns'
+
+    id = Column(Integer, primary_key=True, index=True)
+    conv_id = Column(Integer, ForeignKey('conversations.id'), nullable=False, index=True)
+    idx = Column(Integer, nullable=False)  # 在对话中的序号，从 0 开始
+    sender = Column(String(20), nullable=False)  # Seeker / Finder
+    action_type = Column(String(20), nullable=True)
+    content = Column(Text, nullable=True)
+    system_prompt_hash = Column(String(32), nullable=True)  # 生成该轮时系统提示词的摘要
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    conversation = relationship("Conversation", back_populates="turns")
+
+
+# ==================== 后台任务模型 ====================
+
+class JobStatus(enum.Enum):
+    PENDING = "PENDING"    # 已提交，等待执行
+    STARTED = "STARTED"    # 执行中
+    SUCCESS = "SUCCESS"    # 执行成功
+    FAILURE = "FAILURE"    # 执行失败
+
+
+class Job(Base):
+    """后台任务表，记录图片识别、自动匹配等任务的状态"""
+    __tablename__ = 'jobs'
+
+    id = Column(String(36), primary_key=True)  # 同时作为 Celery 任务 ID
+    type = Column(String(20), nullable=False)  # ANALYZE / MATCH / REFIT_TFIDF
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, index=True)
+    item_id = Column(Integer, ForeignKey('items.id', ondelete='SET NULL'), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
 # ==================== 通知模型 ====================
 
 class Notification(Base):
@@ -160,6 +271,10 @@ class Notification(Base):
     user = relationship("User", back_populates="notifications")
 
 
+# 我的通知（可只看未读），按时间倒序
+Index('ix_notif_user_read_created', Notification.user_id, Notification.is_read, Notification.created_at.desc())
+
+
 # ==================== 归还约定模型 ====================
 
 class ReturnSchedule(Base):
@@ -186,8 +301,16 @@ class ReturnSchedule(Base):
     session = relationship("NegotiationSession", back_populates="return_schedule")
 
 
+Index('ix_sched_session_status', ReturnSchedule.session_id, ReturnSchedule.status)
+
+
 # ==================== 数据库引擎 ====================
 
+def init_db():
+    """创建所有数据表（已存在的表不受影响），部署时执行一次"""
+    Base.metadata.create_all(bind=engine)
+
+
 def get_database_url():
     """获取数据库 URL"""
     if USE_SQLITE:
@@ -195,11 +318,43 @@ def get_database_url():
     return DATABASE_URL
 
 
+def get_async_database_url():
+    """获取异步驱动的数据库 URL（aiosqlite / aiomysql）"""
+    url = get_database_url()
+    if url.startswith("sqlite"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url.replace("mysql+pymysql://", "mysql+aiomysql://", 1)
+
+
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """SQLite 使用 WAL 日志：读写互不阻塞，提交时 fsync 更少"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
 # 创建引擎
+# MySQL 默认 8 小时断开空闲连接，连接池提前回收，避免取到已失效的连接
 db_url = get_database_url()
 if db_url.startswith("sqlite"):
     engine = create_engine(db_url, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_sqlite_pragma)
 else:
-    engine = create_engine(db_url, pool_pre_ping=True)
+    engine = create_engine(db_url, pool_size=20, max_overflow=40, pool_pre_ping=True, pool_recycle=1800)
+
+# 会话工厂：提交后不让对象过期，序列化响应时不必逐个属性重新查询
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+# 异步引擎：只读接口使用，查询时不阻塞事件循环
+async_db_url = get_async_database_url()
+if async_db_url.startswith("sqlite"):
+    async_engine = create_async_engine(async_db_url)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragma)
+else:
+    async_engine = create_async_engine(async_db_url, pool_size=20, max_overflow=40, pool_pre_ping=True,
+                                       pool_recycle=1800)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-print(f"[Database] Using: {'SQLite' if USE_SQLITE else 'MySQL'}")
+logging.getLogger(__name__).info("[Database] Using: %s", 'SQLite' if USE_SQLITE else 'MySQL')
@@ -2,35 +2,155 @@
 核心服务层
 包含匹配、协商、通知等业务逻辑
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, desc
-from typing import List, Optional, Dict, Any
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, insert, update, delete, or_, and_, desc
+from typing import List, Optional, Dict, Any, Tuple
+from functools import lru_cache
+from hashlib import blake2b
 import datetime
+import io
 import json
+import logging
+import os
 import re
+import threading
 
 from models import (
-    Item, ItemType, ItemStatus, ItemImage,
-    NegotiationSession, NegotiationStatus, FailedMatch,
-    Notification, NotificationType, ReturnSchedule, User
+    Item, ItemType, ItemStatus, ItemImage, ItemVector,
+    NegotiationSession, NegotiationStatus, NegotiationMessage, FailedMatch, Conversation,
+    Notification, NotificationType, ReturnSchedule, User, AsyncSessionLocal
 )
 from agents import SeekerAgent, FinderAgent, create_llm
-from config import MAX_NEGOTIATION_ROUNDS, MIN_MATCH_SCORE
+from config import (
+    AUTO_MATCH_CONCURRENCY, MAX_NEGOTIATION_ROUNDS, MIN_MATCH_SCORE, NEGOTIATION_COMMIT_EVERY,
+    TFIDF_MODEL_PATH, TFIDF_MIN_CORPUS
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
 
 # 尝试导入文本相似度库
 try:
     import jieba
+    import joblib
+    import scipy.sparse as sp
     from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    # jieba 导入时把自带的 stderr 输出设为 DEBUG，每次加载词典都会打印
+    jieba.setLogLevel(logging.INFO)
     HAS_SIMILARITY = True
 except ImportError:
     HAS_SIMILARITY = False
-    print("[Warning] jieba/sklearn 未安装，使用简单关键词匹配")
+    logger.warning("jieba/sklearn 未安装，使用简单关键词匹配")
+
+# 全局 TF-IDF 模型（按模型文件修改时间热加载，修改时间同时作为 item_vectors 的模型版本）
+_VECTORIZER = None
+_VECTORIZER_MTIME = None
+_VECTORIZER_FIT_ATTEMPTED = False
+_VECTORIZER_LOCK = threading.Lock()
+
+
+_STOP_WORDS = frozenset({
+    '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很',
+    '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'
+})
+_SPLIT_RE = re.compile(r'[\s,，。！？、；：“”‘’"\'（）\[\]【】]')
+
+
+def _extract_keywords(text: str) -> set:
+    """按标点和空白切分，提取长度不小于 2 的关键词"""
+    words = (w.strip() for w in _SPLIT_RE.split(text))
+    return {w for w in words if len(w) >= 2 and w not in _STOP_WORDS}
+
+
+def _dump_sparse(matrix: "sp.csr_matrix") -> bytes:
+    """稀疏矩阵序列化为 npz 字节串"""
+    buffer = io.BytesIO()
+    sp.save_npz(buffer, matrix, compressed=True)
+    return buffer.getvalue()
+
+
+def _load_sparse(data: bytes) -> "sp.csr_matrix":
+    return sp.load_npz(io.BytesIO(data))
+
+
+@lru_cache(maxsize=1)
+def _get_llm():
+    """进程内共享的 LLM 实例（客户端和连接池只创建一次，实例可在多个线程/协程中并发使用）"""
+    return create_llm()
+
+
+@lru_cache(maxsize=4096)
+def _keyword_hashes(text: str) -> "np.ndarray":
+    """关键词编码为去重排序的 uint64 数组（blake2b 摘要，不受进程哈希随机化影响）"""
+    keywords = _extract_keywords(text)
+    hashes = np.fromiter(
+        (int.from_bytes(blake2b(w.encode(), digest_size=8).digest(), "little") for w in keywords),
+        dtype=np.uint64, count=len(keywords)
+    )
+    return np.unique(hashes)
+
+
+def _keyword_jaccard(text1: str, text2: str) -> float:
+    """两段文本关键词集合的 Jaccard 相似度"""
+    if HAS_NUMPY:
+        hashes1 = _keyword_hashes(text1)
+        hashes2 = _keyword_hashes(text2)
+        if not hashes1.size or not hashes2.size:
+            return 0.0
+        intersection = np.intersect1d(hashes1, hashes2, assume_unique=True).size
+        return intersection / (hashes1.size + hashes2.size - intersection)
+    
+    # 提取关键词
+    keywords1 = _extract_keywords(text1)
+    keywords2 = _extract_keywords(text2)
+    
+    if not keywords1 or not keywords2:
+        return 0.0
+    
+    # 计算 Jaccard 相似度
+    intersection = len(keywords1 & keywords2)
+    union = len(keywords1 | keywords2)
+    
+    return intersection / union if union > 0 else 0.0
+
+
+@lru_cache(maxsize=4096)
+def _cached_sim(text1: str, text2: str) -> float:
+    """
+    关键词 Jaccard 相似度，按文本对缓存
+    
+    只用于 jieba/sklearn 不可用时的逐对匹配（可用时匹配度由 score_matrix 批量计算）；
+    相似度是对称的，调用方按字典序传入两段文本以共用缓存
+    """
+    return _keyword_jaccard(text1, text2)
 
 
 class MatchService:
     """匹配服务"""
     
+    # (字段, 权重)，与 calculate_match_score 保持一致
+    FIELD_WEIGHTS = (("title", 0.3), ("description", 0.3), ("ai_description", 0.3), ("location", 0.1))
+    
+    # 字段 -> 分词缓存列
+    TOKEN_COLUMNS = {
+        "title": "title_tokens",
+        "description": "desc_tokens",
+        "ai_description": "ai_desc_tokens",
+        "location": "location_tokens",
+    }
+    
+    # SQL 粗筛使用的关键词个数和地点前缀长度
+    PREFILTER_KEYWORDS = 5
+    PREFILTER_LOCATION_CHARS = 2
+    
+    # 候选数超过 limit 的多少倍时，先用关键词粗排截取短名单再计算 TF-IDF 匹配度
+    SHORTLIST_FACTOR = 3
+    
     def __init__(self, db: Session):
         self.db = db
     
@@ -40,53 +160,174 @@ class MatchService:
             return " ".join(jieba.cut(text))
         return text
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """计算文本相似度"""
+    def update_tokens(self, item: Item):
+        """发布/编辑物品时预先分词，写入分词缓存列"""
         if not HAS_SIMILARITY:
-            return self._simple_keyword_match(text1, text2)
+            return
+        for field, column in self.TOKEN_COLUMNS.items():
+            text = getattr(item, field)
+            setattr(item, column, self._tokenize(text) if text else None)
+    
+    def _field_tokens(self, item: Item, field: str) -> str:
+        """取物品字段的分词结果，优先使用缓存列"""
+        tokens = getattr(item, self.TOKEN_COLUMNS[field], None)
+        if tokens is not None:
+            return tokens
+        return self._tokenize(getattr(item, field) or "")
+    
+    def fit_vectorizer(self) -> Optional["TfidfVectorizer"]:
+        """
+        在全部物品文本上拟合全局 TF-IDF 模型并写入 TFIDF_MODEL_PATH
+        
+        Returns:
+            拟合好的模型；物品数不足 TFIDF_MIN_CORPUS 时返回 None
+        """
+        fields = [field for field, _ in self.FIELD_WEIGHTS]
+        rows = self.db.execute(select(
+            *(getattr(Item, field) for field in fields),
+            *(getattr(Item, column) for column in self.TOKEN_COLUMNS.values())
+        )).all()
+        if len(rows) < TFIDF_MIN_CORPUS:
+            return None
+        
+        corpus = [" ".join(self._field_tokens(row, field) for field in fields) for row in rows]
+        vectorizer = TfidfVectorizer(max_features=10000, ngram_range=(1, 2), min_df=2).fit(corpus)
+        
+        # 先写临时文件再改名，其他进程不会读到写了一半的模型
+        os.makedirs(os.path.dirname(TFIDF_MODEL_PATH), exist_ok=True)
+        tmp_path = f"{TFIDF_MODEL_PATH}.tmp"
+        joblib.dump(vectorizer, tmp_path)
+        os.replace(tmp_path, TFIDF_MODEL_PATH)
+        logger.info("[MatchService] TF-IDF 模型已更新: %d 个物品, %d 个词", len(corpus), len(vectorizer.vocabulary_))
+        return vectorizer
+    
+    def _get_vectorizer(self, allow_fit: bool = True) -> Optional["TfidfVectorizer"]:
+        """
+        取全局 TF-IDF 模型；没有则返回 None
+        
+        Args:
+            allow_fit: 模型文件不存在时是否在本进程尝试拟合一次（请求处理中不宜同步拟合）
+        """
+        global _VECTORIZER, _VECTORIZER_MTIME, _VECTORIZER_FIT_ATTEMPTED
+        if not HAS_SIMILARITY:
+            return None
         
         try:
-            # 分词
-            tokens1 = self._tokenize(text1)
-            tokens2 = self._tokenize(text2)
-            
-            # TF-IDF 向量化
-            vectorizer = TfidfVectorizer()
-            tfidf_matrix = vectorizer.fit_transform([tokens1, tokens2])
-            
-            # 余弦相似度
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-            return float(similarity)
-        except Exception as e:
-            print(f"[MatchService] 相似度计算失败: {e}")
-            return self._simple_keyword_match(text1, text2)
+            mtime = os.stat(TFIDF_MODEL_PATH).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is None and allow_fit and not _VECTORIZER_FIT_ATTEMPTED:
+            _VECTORIZER_FIT_ATTEMPTED = True
+            try:
+                if self.fit_vectorizer() is not None:
+                    mtime = os.stat(TFIDF_MODEL_PATH).st_mtime_ns
+            except Exception as e:
+                logger.warning("[MatchService] TF-IDF 模型拟合失败: %s", e)
+        
+        if mtime != _VECTORIZER_MTIME:
+            with _VECTORIZER_LOCK:
+                if mtime != _VECTORIZER_MTIME:
+                    _VECTORIZER = joblib.load(TFIDF_MODEL_PATH) if mtime is not None else None
+                    _VECTORIZER_MTIME = mtime
+        return _VECTORIZER
     
-    def _simple_keyword_match(self, text1: str, text2: str) -> float:
-        """简单关键词匹配"""
-        # 提取关键词
-        stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
+    def _transform_fields(self, vectorizer: "TfidfVectorizer", items: List[Any]) -> "sp.csr_matrix":
+        """用全局模型计算物品各字段的向量：每个物品按 FIELD_WEIGHTS 的顺序占连续的若干行"""
+        return vectorizer.transform([
+            self._field_tokens(item, field) for item in items for field, _ in self.FIELD_WEIGHTS
+        ])
+    
+    def store_vector(self, item: Item):
+        """发布/编辑物品时预先计算向量写入 item_vectors（没有全局模型时跳过，由调用方提交）"""
+        vectorizer = self._get_vectorizer(allow_fit=False)
+        if vectorizer is None:
+            return
+        self.db.merge(ItemVector(
+            item_id=item.id,
+            model_version=_VECTORIZER_MTIME,
+            vec=_dump_sparse(self._transform_fields(vectorizer, [item]))
+        ))
+    
+    def rebuild_vectors(self, batch_size: int = 500) -> int:
+        """
+        全局模型更新后重新计算全部物品的向量（后台任务）
         
-        def extract_keywords(text):
-            words = re.split(r'[\s,，。！？、；：""''（）\[\]【】]', text)
-            return set(w.strip() for w in words if w.strip() and len(w.strip()) >= 2 and w.strip() not in stop_words)
+        Returns:
+            写入的向量数
+        """
+        vectorizer = self._get_vectorizer(allow_fit=False)
+        if vectorizer is None:
+            return 0
+        version = _VECTORIZER_MTIME
         
-        keywords1 = extract_keywords(text1)
-        keywords2 = extract_keywords(text2)
+        columns = [Item.id, *(getattr(Item, field) for field, _ in self.FIELD_WEIGHTS),
+                   *(getattr(Item, column) for column in self.TOKEN_COLUMNS.values())]
+        count = 0
+        last_id = 0
+        while True:
+            rows = self.db.execute(
+                select(*columns).where(Item.id > last_id).order_by(Item.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            vectors = self._transform_fields(vectorizer, rows)
+            width = len(self.FIELD_WEIGHTS)
+            self.db.execute(delete(ItemVector).where(ItemVector.item_id.in_(ids)))
+            self.db.execute(insert(ItemVector), [
+                {"item_id": item_id, "model_version": version, "vec": _dump_sparse(vectors[i * width:(i + 1) * width])}
+                for i, item_id in enumerate(ids)
+            ])
+            self.db.commit()
+            count += len(ids)
+            last_id = ids[-1]
         
-        if not keywords1 or not keywords2:
-            return 0.0
+        # 清理旧模型版本遗留的向量（对应物品已不存在）
+        self.db.execute(delete(ItemVector).where(ItemVector.model_version != version))
+        self.db.commit()
+        logger.info("[MatchService] 物品向量已重建: %d 个", count)
+        return count
+    
+    def _item_vectors(self, vectorizer: "TfidfVectorizer", items: List[Item]) -> "sp.csr_matrix":
+        """取物品的字段向量（排列同 _transform_fields）：优先读 item_vectors 中当前模型版本的向量，缺失的现算"""
+        ids = [item.id for item in items if item.id is not None]
+        stored = dict(self.db.execute(
+            select(ItemVector.item_id, ItemVector.vec).where(
+                ItemVector.item_id.in_(ids),
+                ItemVector.model_version == _VECTORIZER_MTIME
+            )
+        ).all()) if ids else {}
         
-        # 计算 Jaccard 相似度
-        intersection = len(keywords1 & keywords2)
-        union = len(keywords1 | keywords2)
+        missing = [item for item in items if item.id not in stored]
+        width = len(self.FIELD_WEIGHTS)
+        fresh = self._transform_fields(vectorizer, missing) if missing else None
+        fresh_index = {id(item): i for i, item in enumerate(missing)}
         
-        return intersection / union if union > 0 else 0.0
+        blocks = []
+        for item in items:
+            if item.id in stored:
+                blocks.append(_load_sparse(stored[item.id]))
+            else:
+                i = fresh_index[id(item)]
+                blocks.append(fresh[i * width:(i + 1) * width])
+        return sp.vstack(blocks, format="csr")
+    
+    def _calculate_similarity(self, text1: str, text2: str) -> float:
+        """计算文本相似度（jieba/sklearn 不可用时的关键词匹配，结果按文本对缓存）"""
+        return _cached_sim(*sorted((text1, text2)))
+    
+    def _simple_keyword_match(self, text1: str, text2: str) -> float:
+        """简单关键词匹配（Jaccard 相似度）"""
+        return _keyword_jaccard(text1, text2)
     
     def calculate_match_score(self, lost_item: Item, found_item: Item) -> float:
         """
         计算两个物品的匹配度
         综合考虑标题、描述、AI描述、地点
         """
+        if HAS_SIMILARITY:
+            return float(self.score_matrix([lost_item], [found_item])[0, 0])
+        
         scores = []
         weights = []
         
@@ -128,30 +369,190 @@ class MatchService:
         
         return round(weighted_score, 4)
     
+    def score_matrix(self, lost_items: List[Item], found_items: List[Item]) -> "np.ndarray":
+        """
+        批量计算匹配度矩阵，形状 (len(lost_items), len(found_items))
+        
+        有全局 TF-IDF 模型时直接 transform，否则每个字段在参与比较的文本上拟合一次
+        （行向量已 L2 归一化），一次稀疏矩阵乘法即得到所有配对的余弦相似度，再按字段权重加权平均。
+        与 calculate_match_score 相同：标题总是计入，其余字段双方都非空时才计入。
+        需要 jieba/sklearn。
+        """
+        n, m = len(lost_items), len(found_items)
+        vectorizer = self._get_vectorizer()
+        # 有全局模型时一次取出全部物品的字段向量，第 k 个字段为每隔 len(FIELD_WEIGHTS) 行的第 k 行
+        vectors = self._item_vectors(vectorizer, lost_items + found_items) if vectorizer is not None else None
+        
+        # 每个字段一层相似度，不计入的配对为 NaN
+        field_sims = np.full((len(self.FIELD_WEIGHTS), n, m), np.nan)
+        for k, (field, _) in enumerate(self.FIELD_WEIGHTS):
+            lost_texts = [getattr(item, field) or "" for item in lost_items]
+            found_texts = [getattr(item, field) or "" for item in found_items]
+            
+            if field == "title":
+                pair_mask = np.ones((n, m), dtype=bool)
+            else:
+                pair_mask = np.outer(
+                    np.fromiter((bool(t) for t in lost_texts), dtype=bool, count=n),
+                    np.fromiter((bool(t) for t in found_texts), dtype=bool, count=m)
+                )
+            
+            sims = np.zeros((n, m))
+            if pair_mask.any():
+                try:
+                    if vectors is not None:
+                        tfidf = vectors[k::len(self.FIELD_WEIGHTS)]
+                    else:
+                        docs = [self._field_tokens(item, field) for item in lost_items + found_items]
+                        tfidf = TfidfVectorizer().fit_transform(docs)
+                    sims = (tfidf[:n] @ tfidf[n:].T).toarray()
+                except ValueError:
+                    # 全部文本都没有有效词（空词表）
+                    pass
+            
+            field_sims[k][pair_mask] = sims[pair_mask]
+        
+        # 按字段权重加权平均，只计入有值的字段
+        weights = np.array([weight for _, weight in self.FIELD_WEIGHTS])[:, None, None]
+        present = ~np.isnan(field_sims)
+        scores = np.nansum(field_sims * weights, axis=0) / np.sum(present * weights, axis=0)
+        return np.round(scores, 4)
+    
+    def match_all(self, lost_items: List[Item]) -> List[Dict[str, Any]]:
+        """
+        为一批丢失物品一次性分配拾取物品（离线全量匹配）
+        
+        按匹配度从高到低贪心分配，每个丢失物品和拾取物品最多出现一次；
+        排除同一用户的物品和已失败的配对。
+        
+        Returns:
+            [{"lost_item": Item, "item": Item, "score": float}, ...]
+        """
+        if not lost_items:
+            return []
+        if not HAS_SIMILARITY:
+            return self._match_all_one_by_one(lost_items)
+        
+        found_items = self.db.query(Item).filter(
+            Item.type == ItemType.FOUND,
+            Item.status.in_([ItemStatus.OPEN, ItemStatus.MATCHING])
+        ).all()
+        if not found_items:
+            return []
+        
+        scores = self.score_matrix(lost_items, found_items)
+        
+        # 排除同一用户的物品和已失败的配对
+        lost_owner = np.array([item.owner_id or -1 for item in lost_items])
+        found_owner = np.array([item.owner_id or -1 for item in found_items])
+        scores[lost_owner[:, None] == found_owner[None, :]] = -1.0
+        
+        lost_index = {item.id: i for i, item in enumerate(lost_items)}
+        found_index = {item.id: j for j, item in enumerate(found_items)}
+        failed_pairs = self.db.query(FailedMatch.lost_item_id, FailedMatch.found_item_id).filter(
+            FailedMatch.lost_item_id.in_(list(lost_index))
+        ).all()
+        for lost_id, found_id in failed_pairs:
+            if found_id in found_index:
+                scores[lost_index[lost_id], found_index[found_id]] = -1.0
+        
+        matches = []
+        used_lost, used_found = set(), set()
+        for i, j, score in match_pairs(scores):
+            if i in used_lost or j in used_found:
+                continue
+            used_lost.add(i)
+            used_found.add(j)
+            matches.append({"lost_item": lost_items[i], "item": found_items[j], "score": score})
+        return matches
+    
+    def _match_all_one_by_one(self, lost_items: List[Item]) -> List[Dict[str, Any]]:
+        """match_all 的降级实现：逐个调用 find_matches"""
+        matches = []
+        claimed_found_ids = set()
+        for lost_item in lost_items:
+            for match in self.find_matches(lost_item):
+                if match["item"].id in claimed_found_ids:
+                    continue
+                claimed_found_ids.add(match["item"].id)
+                matches.append({"lost_item": lost_item, **match})
+                break
+        return matches
+    
+    def _prefilter_condition(self, lost_item: Item):
+        """
+        候选物品的 SQL 粗筛条件：标题或描述包含丢失物品的前几个关键词，或地点前缀相同
+        
+        没有可用的关键词和地点时返回 None（不筛选）
+        """
+        tokens = f"{self._field_tokens(lost_item, 'title')} {self._field_tokens(lost_item, 'description')}"
+        keyword_set = _extract_keywords(tokens)
+        keywords = [w for w in dict.fromkeys(tokens.split()) if w in keyword_set][:self.PREFILTER_KEYWORDS]
+        
+        conditions = [
+            or_(Item.title.contains(k, autoescape=True), Item.description.contains(k, autoescape=True))
+            for k in keywords
+        ]
+        if lost_item.location:
+            location_prefix = lost_item.location[:self.PREFILTER_LOCATION_CHARS]
+            conditions.append(Item.location.contains(location_prefix, autoescape=True))
+        return or_(*conditions) if conditions else None
+    
+    def _coarse_scores(self, lost_item: Item, found_items: List[Item]) -> "np.ndarray":
+        """粗排：全部字段分词结果的关键词 Jaccard 相似度（使用分词缓存列，不做 TF-IDF）"""
+        fields = [field for field, _ in self.FIELD_WEIGHTS]
+        lost_doc = " ".join(self._field_tokens(lost_item, field) for field in fields)
+        return np.fromiter(
+            (self._simple_keyword_match(lost_doc, " ".join(self._field_tokens(item, field) for field in fields))
+             for item in found_items),
+            dtype=float, count=len(found_items)
+        )
+    
     def find_matches(self, lost_item: Item, limit: int = 10) -> List[Dict[str, Any]]:
         """
         为丢失物品查找匹配的拾取物品
         返回按匹配度降序排列的列表
         """
-        # 获取已失败的配对
-        failed_found_ids = self.db.query(FailedMatch.found_item_id).filter(
-            FailedMatch.lost_item_id == lost_item.id
-        ).all()
-        failed_ids = [f[0] for f in failed_found_ids]
+        # 已失败的配对（子查询，由数据库直接排除；found_item_id 为空的行会让 NOT IN 整体不成立，需排除）
+        failed_ids = select(FailedMatch.found_item_id).where(
+            FailedMatch.lost_item_id == lost_item.id,
+            FailedMatch.found_item_id.isnot(None)
+        )
         
-        # 查询可用的 FOUND 物品（排除同一用户的物品）
-        query = self.db.query(Item).filter(
+        # 查询可用的 FOUND 物品（排除同一用户的物品）；
+        # 图片一次 IN 查询批量加载，调用方使用候选物品的图片时不再逐个懒加载
+        query = self.db.query(Item).options(selectinload(Item.images)).filter(
             Item.type == ItemType.FOUND,
             Item.status.in_([ItemStatus.OPEN, ItemStatus.MATCHING]),
             Item.owner_id != lost_item.owner_id  # 排除同一用户的物品
         )
         
-        if failed_ids:
-            query = query.filter(Item.id.notin_(failed_ids))
+        query = query.filter(Item.id.notin_(failed_ids))
+        
+        # 粗筛：标题/描述包含丢失物品的关键词，或地点前缀相同，只对这些候选计算匹配度
+        prefilter = self._prefilter_condition(lost_item)
+        if prefilter is not None:
+            query = query.filter(prefilter)
         
         found_items = query.all()
+        if not found_items:
+            return []
+        
+        # 计算匹配度：每个字段对全部候选只拟合一次 TF-IDF
+        if HAS_SIMILARITY:
+            shortlist_size = limit * self.SHORTLIST_FACTOR
+            if len(found_items) > shortlist_size:
+                coarse = self._coarse_scores(lost_item, found_items)
+                keep = np.argsort(-coarse, kind="stable")[:shortlist_size]
+                found_items = [found_items[j] for j in keep]
+            
+            scores = self.score_matrix([lost_item], found_items)[0]
+            order = np.argsort(-scores, kind="stable")[:limit]
+            return [
+                {"item": found_items[j], "score": float(scores[j])}
+                for j in order if scores[j] >= MIN_MATCH_SCORE
+            ]
         
-        # 计算匹配度
         matches = []
         for found_item in found_items:
             score = self.calculate_match_score(lost_item, found_item)
@@ -167,128 +568,199 @@ class MatchService:
         return matches[:limit]
 
 
+def match_pairs(scores: "np.ndarray", min_score: float = MIN_MATCH_SCORE) -> List[Tuple[int, int, float]]:
+    """从匹配度矩阵中取出不低于阈值的 (行, 列, 分数)，按分数降序排列"""
+    rows, cols = np.nonzero(scores >= min_score)
+    values = scores[rows, cols]
+    order = np.argsort(-values, kind="stable")
+    return list(zip(rows[order].tolist(), cols[order].tolist(), values[order].tolist()))
+
+
 class NegotiationService:
     """协商服务"""
     
     def __init__(self, db: Session):
         self.db = db
-        self.llm = create_llm()
+        self.llm = _get_llm()
         self.match_service = MatchService(db)
     
-    def create_session(self, lost_item_id: int, found_item_id: int, match_score: float = 0.0) -> NegotiationSession:
-        """创建协商会话"""
+    def create_session(self, lost_item: Item, found_item: Item, match_score: float = 0.0) -> NegotiationSession:
+        """创建协商会话（直接使用调用方已加载的物品，会话的物品关联无需再查询）"""
         # 锁定物品
-        lost_item = self.db.query(Item).get(lost_item_id)
-        found_item = self.db.query(Item).get(found_item_id)
-        
-        if lost_item:
-            lost_item.status = ItemStatus.NEGOTIATING
-        if found_item:
-            found_item.status = ItemStatus.NEGOTIATING
+        lost_item.status = ItemStatus.NEGOTIATING
+        found_item.status = ItemStatus.NEGOTIATING
         
         session = NegotiationSession(
-            lost_item_id=lost_item_id,
-            found_item_id=found_item_id,
+            lost_item=lost_item,
+            found_item=found_item,
             match_score=match_score,
-            status=NegotiationStatus.ACTIVE,
-            chat_log=[]
+            status=NegotiationStatus.ACTIVE
         )
         
         self.db.add(session)
         self.db.commit()
-        self.db.refresh(session)
         
         return session
     
+    def _get_conversation(self, session: NegotiationSession) -> Conversation:
+        """获取会话对应的对话日志，不存在则创建"""
+        conversation = self.db.query(Conversation).filter(
+            Conversation.session_id == session.id
+        ).order_by(desc(Conversation.id)).first()
+        
+        if not conversation:
+            conversation = Conversation(
+                session_id=session.id,
+                lost_item_id=session.lost_item_id,
+                found_item_id=session.found_item_id
+            )
+            self.db.add(conversation)
+            self.db.flush()
+        return conversation
+    
     def _hydrate_agents(self, session: NegotiationSession):
         """恢复 Agent 实例"""
+        conv_id = self._get_conversation(session).id
         seeker = SeekerAgent(
             name="SeekerBot",
             llm=self.llm,
-            item_knowledge=session.lost_item
+            item_knowledge=session.lost_item,
+            db=self.db,
+            conv_id=conv_id
         )
         finder = FinderAgent(
             name="FinderBot",
             llm=self.llm,
-            item_knowledge=session.found_item
+            item_knowledge=session.found_item,
+            db=self.db,
+            conv_id=conv_id
         )
         
-        chat_log = session.chat_log if session.chat_log else []
-        seeker.memory = chat_log.copy()
-        finder.memory = chat_log.copy()
+        # 聊天记录和 Turn 表提交频率不同，以更完整的一方为准；
+        # 双方 Agent 共用同一个记忆列表，之后每轮只追加不复制
+        memory = self._load_messages(session)
+        if len(seeker.memory) > len(memory):
+            memory = seeker.memory
+        seeker.memory = finder.memory = memory
         
         return seeker, finder
     
-    def run_full_negotiation(self, session_id: int) -> Dict[str, Any]:
+    def _load_messages(self, session: NegotiationSession) -> List[Dict[str, Any]]:
+        """读取会话的聊天记录；旧数据没有消息行时使用 chat_log 字段"""
+        rows = self.db.execute(
+            select(NegotiationMessage.sender, NegotiationMessage.content, NegotiationMessage.action_type)
+            .where(NegotiationMessage.session_id == session.id)
+            .order_by(NegotiationMessage.id)
+        ).all()
+        if not rows:
+            return list(session.chat_log) if session.chat_log else []
+        return [
+            {"sender": sender, "content": content, "action_type": action_type}
+            for sender, content, action_type in rows
+        ]
+    
+    def _next_agent(self, session: NegotiationSession, seeker: SeekerAgent, finder: FinderAgent):
+        """轮流对话：上一条消息不是失主发的，就轮到失主"""
+        last_sender = None
+        if seeker.memory:
+            last_sender = seeker.memory[-1].get("sender")
+        return seeker if last_sender != "Seeker" else finder
+    
+    def _record_message(self, session: NegotiationSession, seeker: SeekerAgent, finder: FinderAgent,
+                        message: Dict[str, str], round_num: int) -> Optional[Dict[str, Any]]:
         """
-        执行完整的自动协商流程
+        记录一条协商消息并检查是否结束
+        
+        Returns:
+            协商结束时返回结果字典，否则返回 None（调用方负责提交事务）
+        """
+        # 聊天记录追加一行（execute() 已把消息加入双方共享的记忆）
+        self.db.add(NegotiationMessage(
+            session_id=session.id,
+            round_num=round_num,
+            sender=message.get("sender"),
+            content=message.get("content"),
+            action_type=message.get("action_type")
+        ))
+        
+        # 检查结果
+        action_type = message.get("action_type")
+        if action_type in ("AGREE", "REJECT"):
+            seeker.flush_turns()
+            finder.flush_turns()
+        
+        if action_type == "AGREE":
+            session.status = NegotiationStatus.PENDING_CONFIRM
+            session.completed_at = datetime.datetime.utcnow()
+            return {
+                "status": "SUCCESS",
+                "session": session,
+                "rounds": round_num + 1
+            }
+        
+        elif action_type == "REJECT":
+            session.status = NegotiationStatus.FAILED
+            session.completed_at = datetime.datetime.utcnow()
+            return {
+                "status": "FAILED",
+                "session": session,
+                "rounds": round_num + 1
+            }
+        
+        return None
+    
+    def _max_rounds_result(self, session: NegotiationSession) -> Dict[str, Any]:
+        """超过最大轮数，标记失败"""
+        session.status = NegotiationStatus.FAILED
+        session.completed_at = datetime.datetime.utcnow()
+        return {
+            "status": "MAX_ROUNDS",
+            "session": session,
+            "rounds": MAX_NEGOTIATION_ROUNDS
+        }
+    
+    def _cancelled_result(self, session: NegotiationSession) -> Dict[str, Any]:
+        """其他候选已协商成功，未结束的会话标记失败（不记入 FailedMatch，之后仍可再次匹配）"""
+        session.status = NegotiationStatus.FAILED
+        session.completed_at = datetime.datetime.utcnow()
+        return {
+            "status": "CANCELLED",
+            "session": session
+        }
+    
+    def run_full_negotiation(self, session: NegotiationSession) -> Dict[str, Any]:
         """
-        from sqlalchemy.orm.attributes import flag_modified
+        执行完整的自动协商流程
         
-        session = self.db.query(NegotiationSession).get(session_id)
-        if not session or session.status != NegotiationStatus.ACTIVE:
+        Args:
+            session: 已加载双方物品的协商会话（如 create_session 的返回值）
+        """
+        if session.status != NegotiationStatus.ACTIVE:
             return {"error": "会话无效或已结束"}
         
         seeker, finder = self._hydrate_agents(session)
         
         for round_num in range(MAX_NEGOTIATION_ROUNDS):
-            # 轮流对话
-            last_sender = None
-            if session.chat_log:
-                last_sender = session.chat_log[-1].get("sender")
-            
-            current_agent = seeker if last_sender != "Seeker" else finder
+            current_agent = self._next_agent(session, seeker, finder)
             
             # Agent 决策和执行
             decision = current_agent.decide()
             message = current_agent.execute(decision)
             
-            # 更新聊天记录
-            current_log = list(session.chat_log) if session.chat_log else []
-            current_log.append(message)
-            session.chat_log = current_log
-            
-            # 强制标记 JSON 字段为已修改（SQLAlchemy 对 JSON 修改检测有问题）
-            flag_modified(session, "chat_log")
-            self.db.commit()
-            
-            # 同步记忆
-            seeker.memory = current_log.copy()
-            finder.memory = current_log.copy()
-            
-            # 检查结果
-            action_type = message.get("action_type")
-            
-            if action_type == "AGREE":
-                session.status = NegotiationStatus.PENDING_CONFIRM
-                session.completed_at = datetime.datetime.utcnow()
+            # 协商结束时提交；进行中每隔几轮提交一次，进程中断后可从最近的进度恢复
+            result = self._record_message(session, seeker, finder, message, round_num)
+            if result:
                 self.db.commit()
-                return {
-                    "status": "SUCCESS",
-                    "session": session,
-                    "rounds": round_num + 1
-                }
-            
-            elif action_type == "REJECT":
-                session.status = NegotiationStatus.FAILED
-                session.completed_at = datetime.datetime.utcnow()
+                return result
+            if (round_num + 1) % NEGOTIATION_COMMIT_EVERY == 0:
                 self.db.commit()
-                return {
-                    "status": "FAILED",
-                    "session": session,
-                    "rounds": round_num + 1
-                }
         
         # 超过最大轮数
-        session.status = NegotiationStatus.FAILED
-        session.completed_at = datetime.datetime.utcnow()
+        seeker.flush_turns()
+        finder.flush_turns()
+        result = self._max_rounds_result(session)
         self.db.commit()
-        
-        return {
-            "status": "MAX_ROUNDS",
-            "session": session,
-            "rounds": MAX_NEGOTIATION_ROUNDS
-        }
+        return result
     
     def handle_success(self, session: NegotiationSession):
         """处理协商成功"""
@@ -298,20 +770,106 @@ class NegotiationService:
     
     def handle_failure(self, session: NegotiationSession, reason: str = None):
         """处理协商失败"""
-        # 记录失败
-        failed = FailedMatch(
-            lost_item_id=session.lost_item_id,
-            found_item_id=session.found_item_id,
-            session_id=session.id,
-            reason=reason
-        )
-        self.db.add(failed)
+        self.record_failures([(session, reason)], [session.lost_item_id, session.found_item_id])
+    
+    def record_failures(self, failures: List[Tuple[NegotiationSession, Optional[str]]], reset_item_ids: List[int]):
+        """
+        批量记录协商失败，并把指定物品恢复为开放状态
         
-        # 恢复物品状态
-        session.lost_item.status = ItemStatus.OPEN
-        session.found_item.status = ItemStatus.OPEN
+        失败记录一条 INSERT 写入，物品状态一条 UPDATE 更新，只提交一次
+        """
+        if failures:
+            self.db.bulk_insert_mappings(FailedMatch, [
+                {
+                    "lost_item_id": session.lost_item_id,
+                    "found_item_id": session.found_item_id,
+                    "session_id": session.id,
+                    "reason": reason,
+                }
+                for session, reason in failures
+            ])
+        if reset_item_ids:
+            self.db.execute(
+                update(Item).where(Item.id.in_(reset_item_ids)).values(status=ItemStatus.OPEN)
+            )
+        self.db.commit()
+
+
+class BatchNegotiator:
+    """
+    批量协商驱动
+    
+    同时推进多个协商会话：每一轮先为所有进行中的会话选出发言的 Agent，
+    再把这些 LLM 请求合并为一批并发提交，避免逐个会话串行等待。
+    """
+    
+    def __init__(self, db: Session, max_concurrency: int = 8):
+        self.db = db
+        self.negotiation_service = NegotiationService(db)
+        self.max_concurrency = max_concurrency
+    
+    def run(self, sessions: List[NegotiationSession], stop_on_success: bool = False) -> Dict[int, Dict[str, Any]]:
+        """
+        执行多个会话的完整协商
+        
+        Args:
+            sessions: 已加载双方物品的协商会话
+            stop_on_success: 有会话协商成功后不再推进其余会话，
+                其余会话标记为失败，结果状态为 CANCELLED
         
+        Returns:
+            session_id -> 协商结果（格式同 NegotiationService.run_full_negotiation）
+        """
+        service = self.negotiation_service
+        results: Dict[int, Dict[str, Any]] = {}
+        active = {}
+        succeeded = False
+        
+        for session in sessions:
+            if session.status != NegotiationStatus.ACTIVE:
+                results[session.id] = {"error": "会话无效或已结束"}
+                continue
+            active[session.id] = (session, *service._hydrate_agents(session))
+        
+        for round_num in range(MAX_NEGOTIATION_ROUNDS):
+            if not active:
+                break
+            
+            turns = [
+                (session_id, service._next_agent(session, seeker, finder))
+                for session_id, (session, seeker, finder) in active.items()
+            ]
+            decisions = service.llm.generate_batch(
+                [(agent._build_system_prompt(), agent._build_user_prompt()) for _, agent in turns],
+                max_concurrency=self.max_concurrency
+            )
+            
+            for (session_id, agent), decision in zip(turns, decisions):
+                logger.debug("[%s] Decided action: %s", agent.name, decision.get('action'))
+                session, seeker, finder = active[session_id]
+                message = agent.execute(decision)
+                result = service._record_message(session, seeker, finder, message, round_num)
+                if result:
+                    results[session_id] = result
+                    del active[session_id]
+                    succeeded = succeeded or result["status"] == "SUCCESS"
+            
+            if stop_on_success and succeeded:
+                break
+            if (round_num + 1) % NEGOTIATION_COMMIT_EVERY == 0:
+                self.db.commit()
+        
+        # 提前结束或超过最大轮数
+        for session_id, (session, seeker, finder) in active.items():
+            seeker.flush_turns()
+            finder.flush_turns()
+            if stop_on_success and succeeded:
+                results[session_id] = service._cancelled_result(session)
+            else:
+                results[session_id] = service._max_rounds_result(session)
         self.db.commit()
+        
+        return results
 
 
 class NotificationService:
@@ -333,6 +891,38 @@ class NotificationService:
         self.db.commit()
         return notification
     
+    def send_many(self, notifications: List[Dict[str, Any]]):
+        """
+        批量发送通知，一条 INSERT 写入
+        
+        Args:
+            notifications: 每条通知的字段，键同 send 的参数
+        """
+        self.db.bulk_insert_mappings(Notification, [
+            {
+                "user_id": n["user_id"],
+                "type": n["type"],
+                "title": n["title"],
+                "message": n.get("message"),
+                "related_session_id": n.get("session_id"),
+            }
+            for n in notifications
+        ])
+        self.db.commit()
+    
+    @staticmethod
+    async def asend(user_id: int, type: NotificationType, title: str, message: str = None, session_id: int = None):
+        """异步发送通知，使用独立的异步会话，可在请求返回后继续执行"""
+        async with AsyncSessionLocal() as db:
+            db.add(Notification(
+                user_id=user_id,
+                type=type,
+                title=title,
+                message=message,
+                related_session_id=session_id
+            ))
+            await db.commit()
+    
     def get_user_notifications(self, user_id: int, unread_only: bool = False) -> List[Notification]:
         """获取用户通知"""
         query = self.db.query(Notification).filter(Notification.user_id == user_id)
@@ -342,7 +932,7 @@ class NotificationService:
     
     def mark_as_read(self, notification_id: int):
         """标记为已读"""
-        notification = self.db.query(Notification).get(notification_id)
+        notification = self.db.get(Notification, notification_id)
         if notification:
             notification.is_read = True
             self.db.commit()
@@ -361,7 +951,7 @@ class BackgroundTaskService:
         """
         自动匹配流程（后台执行）
         """
-        lost_item = self.db.query(Item).get(lost_item_id)
+        lost_item = self.db.get(Item, lost_item_id)
         if not lost_item:
             return
         
@@ -385,46 +975,45 @@ class BackgroundTaskService:
             )
             return
         
-        # 依次尝试匹配
-        for match in matches:
-            found_item = match["item"]
-            score = match["score"]
+        # 按匹配度从高到低，每次同时协商 AUTO_MATCH_CONCURRENCY 个候选（LLM 请求合并并发提交）；
+        # 每一批结束就写入失败记录并恢复拾取物品状态，worker 中途退出或任务重投时不会留下卡在协商中的物品
+        negotiator = BatchNegotiator(self.db)
+        for start in range(0, len(matches), AUTO_MATCH_CONCURRENCY):
+            batch = matches[start:start + AUTO_MATCH_CONCURRENCY]
+            sessions = [
+                self.negotiation_service.create_session(lost_item, match["item"], match["score"])
+                for match in batch
+            ]
+            results = negotiator.run(sessions, stop_on_success=True)
             
-            # 创建协商会话
-            session = self.negotiation_service.create_session(
-                lost_item.id, found_item.id, score
-            )
+            winner = None
+            failures = []
+            failed_found_ids = []
+            released_ids = []
+            for match, session in zip(batch, sessions):
+                result = results[session.id]
+                status = result.get("status")
+                if status == "SUCCESS" and winner is None:
+                    # 同一轮有多个会话成功时取匹配度最高的
+                    winner = match, session
+                elif status in ("SUCCESS", "CANCELLED"):
+                    # 已有更优的候选，这些配对不算失败，只释放拾取物品
+                    session.status = NegotiationStatus.FAILED
+                    released_ids.append(match["item"].id)
+                else:
+                    failures.append((session, status or result.get("error")))
+                    failed_found_ids.append(match["item"].id)
             
-            # 执行协商
-            result = self.negotiation_service.run_full_negotiation(session.id)
+            self.negotiation_service.record_failures(failures, failed_found_ids + released_ids)
             
-            if result.get("status") == "SUCCESS":
+            if winner is not None:
                 # 协商成功，通知双方确认
-                self.notification_service.send(
-                    user_id=lost_item.owner_id,
-                    type=NotificationType.MATCH_FOUND,
-                    title="找到疑似匹配物品！",
-                    message=f"系统为您找到了一个匹配度 {score*100:.0f}% 的物品，请确认是否是您丢失的物品。",
-                    session_id=session.id
-                )
-                
-                self.notification_service.send(
-                    user_id=found_item.owner_id,
-                    type=NotificationType.MATCH_FOUND,
-                    title="您拾取的物品可能找到失主啦！",
-                    message="有用户的丢失物品与您拾取的物品匹配，请等待对方确认。",
-                    session_id=session.id
-                )
+                match, session = winner
+                self._notify_match_found(lost_item, match["item"], match["score"], session)
                 return
-            
-            else:
-                # 协商失败，继续下一个
-                self.negotiation_service.handle_failure(session, result.get("status"))
-                continue
         
         # 所有匹配都失败
-        lost_item.status = ItemStatus.OPEN
-        self.db.commit()
+        self.negotiation_service.record_failures([], [lost_item.id])
         
         self.notification_service.send(
             user_id=lost_item.owner_id,
@@ -432,3 +1021,72 @@ class BackgroundTaskService:
             title="暂无匹配物品",
             message=f"系统尝试了 {len(matches)} 个可能匹配的物品，但都未能确认。我们会持续为您搜索。"
         )
+    
+    def _notify_match_found(self, lost_item: Item, found_item: Item, score: float, session: NegotiationSession):
+        """协商成功，通知双方确认"""
+        self.notification_service.send_many(self._match_found_notifications(lost_item, found_item, score, session))
+    
+    @staticmethod
+    def _match_found_notifications(lost_item: Item, found_item: Item, score: float,
+                                   session: NegotiationSession) -> List[Dict[str, Any]]:
+        return [
+            {
+                "user_id": lost_item.owner_id,
+                "type": NotificationType.MATCH_FOUND,
+                "title": "找到疑似匹配物品！",
+                "message": f"系统为您找到了一个匹配度 {score*100:.0f}% 的物品，请确认是否是您丢失的物品。",
+                "session_id": session.id,
+            },
+            {
+                "user_id": found_item.owner_id,
+                "type": NotificationType.MATCH_FOUND,
+                "title": "您拾取的物品可能找到失主啦！",
+                "message": "有用户的丢失物品与您拾取的物品匹配，请等待对方确认。",
+                "session_id": session.id,
+            },
+        ]
+    
+    def run_batch_matching(self, max_concurrency: int = 8) -> Dict[int, str]:
+        """
+        批量匹配所有开放的丢失物品（离线任务）
+        
+        用匹配度矩阵一次性为所有丢失物品分配候选，所有会话由 BatchNegotiator
+        同时推进；失败的配对会记入 FailedMatch，下次运行时自动尝试下一个候选。
+        
+        Returns:
+            lost_item_id -> 协商结果状态
+        """
+        lost_items = self.db.query(Item).filter(
+            Item.type == ItemType.LOST,
+            Item.status == ItemStatus.OPEN
+        ).all()
+        
+        pairs = {}
+        sessions = []
+        for match in self.match_service.match_all(lost_items):
+            lost_item, found_item = match["lost_item"], match["item"]
+            session = self.negotiation_service.create_session(lost_item, found_item, match["score"])
+            pairs[session.id] = (lost_item, found_item, match["score"])
+            sessions.append(session)
+        
+        results = BatchNegotiator(self.db, max_concurrency).run(sessions)
+        
+        statuses = {}
+        notifications = []
+        failures = []
+        failed_item_ids = []
+        for session_id, result in results.items():
+            lost_item, found_item, score = pairs[session_id]
+            session = result.get("session")
+            statuses[lost_item.id] = result.get("status") or result.get("error")
+            if result.get("status") == "SUCCESS":
+                notifications.extend(self._match_found_notifications(lost_item, found_item, score, session))
+            elif session is not None:
+                failures.append((session, result.get("status")))
+                failed_item_ids.extend((lost_item.id, found_item.id))
+        
+        self.negotiation_service.record_failures(failures, failed_item_ids)
+        if notifications:
+            self.notification_service.send_many(notifications)
+        
+        return statuses
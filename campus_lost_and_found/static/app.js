@@ -164,24 +164,47 @@ document.querySelectorAll('.filter-btn').forEach(btn => {
     });
 });
 
+// ===== 分页 =====
+// 列表接口按 next_cursor 翻页，依次请求直到没有下一页，返回全部条目
+async function fetchAllPages(endpoint) {
+    const items = [];
+    let cursor = null;
+    do {
+        const separator = endpoint.includes('?') ? '&' : '?';
+        const page = await apiRequest(cursor === null ? endpoint : `${endpoint}${separator}cursor=${cursor}`);
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor !== null);
+    return items;
+}
+
 // ===== 加载物品列表 =====
-async function loadItems() {
+let itemsCursor = null;
+
+async function loadItems(append = false) {
     const container = document.getElementById('items-container');
-    container.innerHTML = '<div class="empty-state"><div class="icon">⏳</div><p>加载中...</p></div>';
+    if (!append) {
+        itemsCursor = null;
+        container.innerHTML = '<div class="empty-state"><div class="icon">⏳</div><p>加载中...</p></div>';
+    }
+
+    // 类型在服务端筛选；“加载更多”从上一页的 next_cursor 继续
+    const params = new URLSearchParams();
+    if (currentFilter !== 'all') params.set('type', currentFilter);
+    if (append && itemsCursor !== null) params.set('cursor', itemsCursor);
+    const query = params.toString();
 
     try {
-        const items = await apiRequest('/items/');
-        let filtered = items;
-        if (currentFilter !== 'all') {
-            filtered = items.filter(item => item.type === currentFilter);
-        }
+        // 每次都向服务端校验（未变化时 304），刚发布/编辑/删除的物品不会被浏览器缓存挡住
+        const { items, next_cursor } = await apiRequest(query ? `/items/?${query}` : '/items/', { cache: 'no-cache' });
+        itemsCursor = next_cursor;
 
-        if (filtered.length === 0) {
+        if (!append && items.length === 0) {
             container.innerHTML = '<div class="empty-state"><div class="icon">📭</div><p>暂无物品信息</p></div>';
             return;
         }
 
-        container.innerHTML = filtered.map(item => `
+        const html = items.map(item => `
             <div class="item-card ${item.type.toLowerCase()}" onclick="showItemDetail(${item.id})">
                 ${item.images && item.images[0] ? `<div class="item-image"><img src="${item.images[0]}" alt="${escapeHtml(item.title)}"></div>` : ''}
                 <div class="item-header">
@@ -195,8 +218,23 @@ async function loadItems() {
                 </div>
             </div>
         `).join('');
+
+        document.getElementById('items-load-more')?.remove();
+        if (append) {
+            container.insertAdjacentHTML('beforeend', html);
+        } else {
+            container.innerHTML = html;
+        }
+        if (next_cursor !== null) {
+            container.insertAdjacentHTML('beforeend',
+                '<button id="items-load-more" class="action-btn load-more" onclick="loadItems(true)">加载更多</button>');
+        }
     } catch (error) {
-        container.innerHTML = `<div class="empty-state"><div class="icon">❌</div><p>加载失败: ${error.message}</p></div>`;
+        if (append) {
+            showToast(`加载失败: ${error.message}`, 'error');
+        } else {
+            container.innerHTML = `<div class="empty-state"><div class="icon">❌</div><p>加载失败: ${error.message}</p></div>`;
+        }
     }
 }
 
@@ -206,7 +244,7 @@ async function loadMyItems() {
     container.innerHTML = '<div class="empty-state"><div class="icon">⏳</div><p>加载中...</p></div>';
 
     try {
-        const items = await apiRequest('/items/my');
+        const items = await fetchAllPages('/items/my');
 
         if (items.length === 0) {
             container.innerHTML = '<div class="empty-state"><div class="icon">📭</div><p>您还没有发布过物品</p></div>';
@@ -302,7 +340,7 @@ async function loadNotifications() {
     container.innerHTML = '<div class="empty-state"><div class="icon">⏳</div><p>加载中...</p></div>';
 
     try {
-        const notifications = await apiRequest('/notifications/');
+        const notifications = await fetchAllPages('/notifications/');
 
         if (notifications.length === 0) {
             container.innerHTML = '<div class="empty-state"><div class="icon">🔔</div><p>暂无消息</p></div>';
@@ -729,9 +767,10 @@ document.getElementById('image-input').addEventListener('change', async (e) => {
     try {
         const response = await fetch('/images/analyze', { method: 'POST', body: formData });
         const result = await response.json();
+        if (!response.ok) throw new Error(result.detail || '上传失败');
 
         uploadedImagePath = result.path;
-        aiDescription = result.ai_description;
+        aiDescription = await waitForAnalysis(result.job_id);
 
         document.getElementById('ai-loading').style.display = 'none';
         document.getElementById('ai-result').style.display = 'block';
@@ -743,6 +782,18 @@ document.getElementById('image-input').addEventListener('change', async (e) => {
     }
 });
 
+// 轮询识别任务，直到完成
+async function waitForAnalysis(jobId) {
+    for (let i = 0; i < 120; i++) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        if (job.status === 'SUCCESS') return job.result.ai_description;
+        if (job.status === 'FAILURE' || !response.ok) throw new Error(job.result || job.detail || '识别失败');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+    throw new Error('识别超时');
+}
+
 function removeImage() {
     document.getElementById('image-input').value = '';
     document.querySelector('.upload-placeholder').style.display = 'flex';
@@ -828,7 +879,7 @@ async function loadMatchProgress(filter = null) {
     container.innerHTML = '<div class="empty-state"><div class="icon">⏳</div><p>加载中...</p></div>';
 
     try {
-        const sessions = await apiRequest('/negotiations/');
+        const sessions = await fetchAllPages('/negotiations/');
 
         let filtered = sessions;
         if (currentProgressFilter === 'active') {
@@ -972,7 +1023,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     if (authToken) {
         setInterval(async () => {
             try {
-                const notifs = await apiRequest('/notifications/?unread_only=true');
+                const notifs = await fetchAllPages('/notifications/?unread_only=true');
                 updateNotifBadge(notifs.length);
             } catch { }
         }, 30000);
@@ -0,0 +1,156 @@
+"""
+后台任务
+配置了 CELERY_BROKER_URL 时由 Celery worker 执行，否则在 Web 进程内的线程池中执行；
+任务状态统一记录在 Job 表中
+
+启动 worker:
+    celery -A tasks worker -Q celery -c 4        # 图片识别
+    celery -A tasks worker -Q matching -c 4      # 自动匹配
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from image_service import image_service
+from models import SessionLocal, Job, JobStatus
+from services import BackgroundTaskService, MatchService
+
+try:
+    from celery import Celery
+    HAS_CELERY = True
+except ImportError:
+    HAS_CELERY = False
+
+logger = logging.getLogger(__name__)
+
+celery_app = None
+if HAS_CELERY and CELERY_BROKER_URL:
+    celery_app = Celery("lost_and_found", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+    celery_app.conf.update(
+        task_acks_late=True,  # worker 执行完才确认，中途退出的任务会重新投递
+        task_ignore_result=True,  # 结果写入 Job 表，不需要 result backend
+        worker_prefetch_multiplier=1,  # 任务耗时长，避免单个 worker 囤积任务
+        task_routes={
+            "tasks.match_item": {"queue": "matching"},
+            "tasks.refit_vectorizer": {"queue": "matching"},
+        },
+    )
+
+# 未配置 Celery 时的进程内执行器（仅本地开发使用，重启后未完成的任务不会继续）
+_LOCAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job")
+
+
+# ==================== 任务状态 ====================
+
+def _create_job(job_type: str, item_id: Optional[int] = None) -> str:
+    db = SessionLocal()
+    try:
+        job = Job(id=uuid.uuid4().hex, type=job_type, status=JobStatus.PENDING, item_id=item_id)
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def _update_job(job_id: str, status: JobStatus, result: Any = None, error: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(
+            {Job.status: status, Job.result: result, Job.error: error},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run_job(job_id: str, func: Callable, *args):
+    """执行任务函数并记录状态"""
+    _update_job(job_id, JobStatus.STARTED)
+    try:
+        result = func(*args)
+    except Exception as e:
+        logger.exception("[Job] %s failed", job_id)
+        _update_job(job_id, JobStatus.FAILURE, error=str(e))
+        return
+    _update_job(job_id, JobStatus.SUCCESS, result=result)
+
+
+# ==================== 任务定义 ====================
+
+def _analyze(image_path: str, item_type: str) -> Dict[str, Any]:
+    return {
+        "path": image_path,
+        "url": f"/static/{image_path}",
+        "ai_description": image_service.analyze_image_sync(image_path, item_type)
+    }
+
+
+def _match(item_id: int) -> None:
+    db = SessionLocal()
+    try:
+        BackgroundTaskService(db).run_auto_matching(item_id)
+    finally:
+        db.close()
+
+
+def _refit_vectorizer() -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        service = MatchService(db)
+        vectorizer = service.fit_vectorizer()
+        if vectorizer is None:
+            return {"vocabulary_size": 0, "vectors": 0}
+        # 旧模型下预先计算的物品向量已失效，随模型一起重建
+        return {"vocabulary_size": len(vectorizer.vocabulary_), "vectors": service.rebuild_vectors()}
+    finally:
+        db.close()
+
+
+if celery_app is not None:
+    @celery_app.task(name="tasks.analyze_image")
+    def analyze_task(job_id: str, image_path: str, item_type: str):
+        _run_job(job_id, _analyze, image_path, item_type)
+
+    @celery_app.task(name="tasks.match_item")
+    def match_task(job_id: str, item_id: int):
+        _run_job(job_id, _match, item_id)
+
+    @celery_app.task(name="tasks.refit_vectorizer")
+    def refit_vectorizer_task(job_id: str):
+        _run_job(job_id, _refit_vectorizer)
+
+
+# ==================== 提交任务 ====================
+
+def submit_analyze(image_path: str, item_type: str) -> str:
+    """提交图片识别任务，返回任务 ID"""
+    job_id = _create_job("ANALYZE")
+    if celery_app is not None:
+        analyze_task.apply_async(args=(job_id, image_path, item_type), task_id=job_id)
+    else:
+        _LOCAL_EXECUTOR.submit(_run_job, job_id, _analyze, image_path, item_type)
+    return job_id
+
+
+def submit_matching(item_id: int) -> str:
+    """提交自动匹配任务，返回任务 ID"""
+    job_id = _create_job("MATCH", item_id)
+    if celery_app is not None:
+        match_task.apply_async(args=(job_id, item_id), task_id=job_id)
+    else:
+        _LOCAL_EXECUTOR.submit(_run_job, job_id, _match, item_id)
+    return job_id
+
+
+def submit_refit_vectorizer() -> str:
+    """提交重新拟合全局 TF-IDF 模型的任务，返回任务 ID"""
+    job_id = _create_job("REFIT_TFIDF")
+    if celery_app is not None:
+        refit_vectorizer_task.apply_async(args=(job_id,), task_id=job_id)
+    else:
+        _LOCAL_EXECUTOR.submit(_run_job, job_id, _refit_vectorizer)
+    return job_id
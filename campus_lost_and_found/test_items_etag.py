@@ -0,0 +1,45 @@
+import conftest  # noqa: F401  直接运行脚本时同样使用临时 SQLite
+from fastapi.testclient import TestClient
+from main import app
+from models import SessionLocal, User, Item, ItemType
+
+client = TestClient(app)
+
+
+def _seed_items(n: int):
+    db = SessionLocal()
+    owner = User(username="etag_owner", password_hash="x", name="Owner", contact_info="1")
+    db.add(owner)
+    db.flush()
+    for i in range(n):
+        db.add(Item(title=f"物品{i}", description="描述", type=ItemType.FOUND, location="图书馆", owner_id=owner.id))
+    db.commit()
+    db.close()
+
+
+def test_items_etag_differs_per_page():
+    _seed_items(3)
+
+    first = client.get("/items/", params={"limit": 1})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    cursor = first.json()["next_cursor"]
+    assert cursor is not None
+
+    # 同一页带上 ETag 重新验证，未变化时返回 304
+    assert client.get("/items/", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 304
+
+    # 第二页、不同页大小不能复用第一页的 ETag
+    second = client.get("/items/", params={"limit": 1, "cursor": cursor}, headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["etag"] != etag
+    assert second.json()["items"][0]["id"] < cursor
+
+    wider = client.get("/items/", params={"limit": 2}, headers={"If-None-Match": etag})
+    assert wider.status_code == 200
+    assert len(wider.json()["items"]) == 2
+
+
+if __name__ == "__main__":
+    test_items_etag_differs_per_page()
+    print("OK")